@@ -10,6 +10,83 @@ DEBUG = True
 TITLE = 'VocPrez'
 
 
+#
+#   Vocabulary index cache
+#
+# The index of all vocabs from the VOCAB_SOURCES below is pickled to VOCAB_CACHE_PATH. An index older than
+# VOCAB_CACHE_DAYS days is rebuilt in the background while the old one continues to be served
+VOCAB_CACHE_PATH = path.join(APP_DIR, 'cache', 'VOCABS.p')
+VOCAB_CACHE_DAYS = 1
+
+# The vocab sources are collected concurrently by up to VOCAB_COLLECT_WORKERS threads. Each may take up to
+# VOCAB_COLLECT_TIMEOUT seconds, or the 'collect_timeout' given in its VOCAB_SOURCES entry, before it is skipped
+VOCAB_COLLECT_WORKERS = 8
+VOCAB_COLLECT_TIMEOUT = 120
+
+# The results of the last VOCAB_REGISTER_SEARCH_CACHE distinct /vocabulary/ searches are kept until the index is rebuilt
+VOCAB_REGISTER_SEARCH_CACHE = 256
+
+# The labels of every vocab's Concepts are indexed, listing up to LABEL_INDEX_WORKERS vocabs at once, for /autocomplete.
+# It finds LABEL_SEARCH_LIMIT Concepts unless asked for more, up to LABEL_SEARCH_MAX_LIMIT
+LABEL_INDEX_WORKERS = 8
+LABEL_SEARCH_LIMIT = 10
+LABEL_SEARCH_MAX_LIMIT = 100
+
+# RVA sources look their vocabs up in the registry with up to RVA_COLLECT_WORKERS requests at once
+RVA_COLLECT_WORKERS = 8
+
+
+#
+#   SPARQL endpoint connections
+#
+# Queries to each SPARQL endpoint share a pool of up to SPARQL_POOL_SIZE kept-alive connections. The timeouts are in
+# seconds. A page's queries also wait for a response no longer than its PAGE_DEADLINE, below
+SPARQL_POOL_SIZE = 10
+SPARQL_CONNECT_TIMEOUT = 5
+SPARQL_READ_TIMEOUT = 30
+
+# SPARQL query results are cached for SPARQL_CACHE_TTL seconds (0 turns the cache off). The least recently used results
+# are evicted to keep within SPARQL_CACHE_MAX_ENTRIES results and about SPARQL_CACHE_MAX_BYTES bytes
+SPARQL_CACHE_TTL = 3600
+SPARQL_CACHE_MAX_ENTRIES = 1000
+SPARQL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# A page's independent queries run together on a pool of QUERY_WORKERS threads, shared by all requests. A page waits up
+# to PAGE_DEADLINE seconds for them and then renders without any that haven't finished. Those still running can't be
+# stopped but their queries stop waiting for a response at the deadline, giving their threads back
+QUERY_WORKERS = 16
+PAGE_DEADLINE = 30
+
+# Concept documents fetched over HTTP (e.g. when crawling narrower Concepts with NARROWER_WORKERS threads) are kept in
+# DOCUMENT_CACHE_DIR and used without revalidation for DOCUMENT_CACHE_MAX_AGE seconds. Failed fetches are tried up to
+# DOCUMENT_FETCH_ATTEMPTS times, backing off exponentially from DOCUMENT_FETCH_BACKOFF seconds
+DOCUMENT_CACHE_DIR = path.join(APP_DIR, 'cache', 'documents')
+DOCUMENT_CACHE_MAX_AGE = 3600
+DOCUMENT_FETCH_ATTEMPTS = 5
+DOCUMENT_FETCH_BACKOFF = 0.5
+NARROWER_WORKERS = 8
+
+# VOCBENCH sources share up to VB_SESSION_POOL_SIZE idle logged-in sessions, each logged in again after
+# VB_SESSION_MAX_AGE seconds or when VocBench rejects it
+VB_SESSION_POOL_SIZE = 10
+VB_SESSION_MAX_AGE = 1800
+# VOCBENCH project exports are harvested to disk VB_HARVEST_CHUNK_SIZE bytes at a time, resuming where an interrupted
+# harvest stopped if VocBench gave the export an ETag or Last-Modified date. VB_HARVEST_TIMEOUT is (connect, read) seconds
+VB_HARVEST_CHUNK_SIZE = 1024 * 1024
+VB_HARVEST_TIMEOUT = (10, 300)
+
+# FILE vocabs' graphs are kept in memory once loaded. The least recently used are dropped when their pickle files add up
+# to more than FILE_GRAPH_CACHE_MAX_BYTES bytes
+FILE_GRAPH_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# New or changed FILE vocab files are parsed by up to FILE_PARSE_WORKERS processes at startup (defaults to the CPU count)
+# FILE_PARSE_WORKERS = 4
+
+# FILE vocabs can also be kept as compact, memory-mapped triple stores, which take a fraction of the memory of rdflib
+# Graphs and are shared between processes
+FILE_COMPACT_STORE = False
+
+
 #
 #   Vocabulary data sources
 #
@@ -22,6 +99,7 @@ class VocabSource:
     RVA = 'RVA'
     VOCBENCH = 'VOCBENCH'
     GITHUB = 'GITHUB'
+    OXIGRAPH = 'OXIGRAPH'
 
 
 VOCAB_SOURCES = {
@@ -48,5 +126,14 @@ VOCAB_SOURCES = {
                 'uri': '',
             }
         ]
-    }
+    },
+    # an example of serving the vocab files in vocab_files/, each parsed once and kept pickled until it changes
+    # 'files': {
+    #     'source': VocabSource.FILE,
+    # },
+    # an example of loading local vocab files into an embedded Oxigraph store (needs pyoxigraph installed)
+    # 'local': {
+    #     'source': VocabSource.OXIGRAPH,
+    #     'store_path': '',
+    # },
 }
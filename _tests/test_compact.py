@@ -0,0 +1,64 @@
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.namespace import SKOS, XSD
+from data.source._compact import CompactGraph
+
+S = URIRef('http://example.org/concept/1')
+NARROWER = URIRef('http://example.org/concept/2')
+NODE = BNode('n1')
+OBJECTS = [
+    Literal('Granite', lang='en'),
+    Literal('Granite', lang='en-AU'),
+    Literal('Granite'),
+    Literal('Granite', datatype=XSD.string),
+    Literal('2020-01-02', datatype=XSD.date),
+    Literal('a\x00b'),
+    Literal('a\x00b', lang='en'),
+    Literal('\x00', datatype=URIRef('http://example.org/type\x00')),
+    Literal(''),
+    NARROWER,
+    NODE,
+]
+
+
+def make_graph():
+    g = Graph()
+    for o in OBJECTS:
+        g.add((S, SKOS.note, o))
+    g.add((S, SKOS.prefLabel, Literal('Granite', lang='en')))
+    g.add((NODE, SKOS.prefLabel, Literal('a\x00b', lang='en')))
+    return g
+
+
+def compact(g, tmp_path):
+    path = str(tmp_path / 'vocab.cg')
+    CompactGraph.write(g, path)
+    assert CompactGraph.is_current(path)
+    return CompactGraph(path)
+
+
+def test_round_trip(tmp_path):
+    g = make_graph()
+    cg = compact(g, tmp_path)
+    assert len(cg) == len(g)
+    assert set(cg.triples((None, None, None))) == set(g.triples((None, None, None)))
+
+
+def test_triple_patterns(tmp_path):
+    g = make_graph()
+    cg = compact(g, tmp_path)
+    terms = [None, S, NODE, SKOS.note, SKOS.prefLabel] + OBJECTS
+    for s in [None, S, NODE]:
+        for p in [None, SKOS.note, SKOS.prefLabel]:
+            for o in terms:
+                assert set(cg.triples((s, p, o))) == set(g.triples((s, p, o))), (s, p, o)
+
+
+def test_distinct_literals(tmp_path):
+    # literals differing only in language, datatype or an embedded NUL are different terms
+    cg = compact(make_graph(), tmp_path)
+    for o in OBJECTS:
+        assert (S, SKOS.note, o) in cg, o
+        assert list(cg.subjects(SKOS.note, o)) == [S], o
+    assert (S, SKOS.note, Literal('a')) not in cg
+    assert (S, SKOS.note, Literal('Granite', lang='de')) not in cg
+    assert cg.value(NODE, SKOS.prefLabel) == Literal('a\x00b', lang='en')
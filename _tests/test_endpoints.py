@@ -1027,4 +1027,20 @@ def test_file_vocabulary_instance_concept_instance_alternates_view_app_n_triples
             line = line.strip()
             if line != '':
                 result = re.search(N_TRIPLES_PATTERN, line)
-                assert result is not None, 'URL: {} \n\nLine: {}'.format(BASE_URL, line)
\ No newline at end of file
+                assert result is not None, 'URL: {} \n\nLine: {}'.format(BASE_URL, line)
+
+#
+# -- Test autocomplete -------------------------------------------------------------------------------------------------
+#
+def test_autocomplete_app_json():
+    for BASE_URL in BASE_URLS:
+        content = requests.get(BASE_URL + '/autocomplete?q=CONTA').content.decode('utf-8')
+        content = json.loads(content)
+        assert 'http://resource.geosciml.org/classifier/cgi/contacttype/contact' in \
+               [match['uri'] for match in content], BASE_URL
+        assert all('vocab_id' in match and 'prefLabel' in match for match in content), BASE_URL
+
+
+def test_autocomplete_no_query():
+    for BASE_URL in BASE_URLS:
+        assert requests.get(BASE_URL + '/autocomplete').status_code == 400, BASE_URL
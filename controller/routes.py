@@ -6,7 +6,9 @@ from model.skos_register import SkosRegisterRenderer
 import _config as config
 import markdown
 from data.source._source import Source
+from data.source.FILE import FILE
 from data.source.VOCBENCH import VbException
+from data.vocab_index import VOCAB_INDEX
 import json
 from pyldapi import Renderer
 import controller.sparql_endpoint_functions
@@ -46,6 +48,18 @@ Instead, found **{}**.""".format(vocab_id, uri, c_type)
     return render_template('error.html', title='Error - Object Class URI', heading='Concept Class Type Error', msg=msg)
 
 
+def get_vocab_source(vocab_id, language):
+    """
+    Makes the source that reads a vocab: FILE vocabs are read from their own graphs, all others with SPARQL queries
+
+    :return: the vocab's Source
+    :rtype: :class:`data.source._source.Source`
+    """
+    if g.VOCABS[vocab_id].data_source == config.VocabSource.FILE:
+        return FILE(vocab_id, request, language)
+    return Source(vocab_id, request, language)
+
+
 def get_a_vocab_key():
     """
     Get the first key from the g.VOCABS dictionary.
@@ -88,48 +102,26 @@ def get_a_vocab_source_key():
         return None
 
 
-def match(vocabs, query):
-    """
-    Generate a generator of vocabulary items that match the search query
-
-    :param vocabs: The vocabulary list of items.
-    :param query: The search query string.
-    :return: A generator of words that match the search query.
-    :rtype: generator
-    """
-    for word in vocabs:
-        if query.lower() in word.title.lower():
-            yield word
-
-
 @routes.route('/vocabulary/')
 def vocabularies():
     page = int(request.values.get('page')) if request.values.get('page') is not None else 1
     per_page = int(request.values.get('per_page')) if request.values.get('per_page') is not None else 20
 
-    # TODO: replace this logic with the following
-    #   1. read all static vocabs from g.VOCABS
-    # get this instance's list of vocabs
-    vocabs = []  # local copy (to this request) for sorting
-    for k, voc in g.VOCABS.items():
-        vocabs.append(voc)
-    vocabs.sort(key=lambda v: v.title)
-    total = len(g.VOCABS.items())
+    # the index's register view is already sorted by title
+    register = g.VOCAB_REGISTER
+    total = len(register)
 
     # Search
     query = request.values.get('search')
-    results = []
+    matches = None
     if query:
-        for m in match(vocabs, query):
-            results.append(m)
-        vocabs[:] = results
-        vocabs.sort(key=lambda v: v.title)
-        total = len(vocabs)
+        matches = register.search(query)
+        total = len(matches)
 
     # generate vocabs list for requested page and per_page
     start = (page-1)*per_page
     end = start + per_page
-    vocabs = vocabs[start:end]
+    vocabs = register.page(start, end, matches)
 
     # render the list of vocabs
     return SkosRegisterRenderer(
@@ -153,7 +145,7 @@ def vocabulary(vocab_id):
 
     # get vocab details using appropriate source handler
     try:
-        vocab = Source(vocab_id, request, language).get_vocabulary()
+        vocab = get_vocab_source(vocab_id, language).get_vocabulary()
     except VbException as e:
         return render_vb_exception_response(e)
 
@@ -170,26 +162,16 @@ def vocabulary_list(vocab_id):
     if vocab_id not in g.VOCABS.keys():
         return render_invalid_vocab_id_response()
     
-    vocab_source = Source(vocab_id, request, language)
-    concepts = vocab_source.list_concepts()
-    concepts.sort(key=lambda x: x['title'])
-    total = len(concepts)
-
-    # Search
-    query = request.values.get('search')
-    results = []
-    if query:
-        for m in match(concepts, query):
-            results.append(m)
-        concepts[:] = results
-        concepts.sort(key=lambda x: x['title'])
-        total = len(concepts)
-
     page = int(request.values.get('page')) if request.values.get('page') is not None else 1
     per_page = int(request.values.get('per_page')) if request.values.get('per_page') is not None else 20
-    start = (page - 1) * per_page
-    end = start + per_page
-    concepts = concepts[start:end]
+    sort = request.values.get('sort') or 'title'
+
+    vocab_source = get_vocab_source(vocab_id, language)
+
+    # Search, only fetching the requested page
+    query = request.values.get('search')
+    total = vocab_source.count_concepts(query)
+    concepts = vocab_source.list_concepts(page, per_page, sort, query)
 
     test = SkosRegisterRenderer(
         request,
@@ -249,24 +231,21 @@ def object():
             mimetype='text/plain'
         )
         
-    vocab_source = Source(vocab_id, request, language)
+    vocab_source = get_vocab_source(vocab_id, language)
 
     try:
-        # TODO reuse object within if, rather than re-loading graph
-        c = vocab_source.get_object_class()
+        # the object's class and the object itself come back together
+        c, obj = vocab_source.get_object(uri)
 
         if c == 'http://www.w3.org/2004/02/skos/core#Concept':
-            concept = vocab_source.get_concept()
             return ConceptRenderer(
                 request,
-                concept
+                obj
             ).render()
         elif c == 'http://www.w3.org/2004/02/skos/core#Collection':
-            collection = vocab_source.get_collection(uri)
-
             return CollectionRenderer(
                 request,
-                collection
+                obj
             ).render()
         else:
             return render_invalid_object_class_response(vocab_id, uri, c)
@@ -275,6 +254,36 @@ def object():
 
 
 
+@routes.route('/autocomplete')
+def autocomplete():
+    """
+    Finds Concepts in any vocab by the start of the words of their prefLabel, altLabel or hiddenLabel, ignoring case
+    and accents, for autocompleting a search box
+
+    An HTTP URI query string argument parameter 'q' must be supplied, the text typed so far. An optional 'limit', up to
+    LABEL_SEARCH_MAX_LIMIT, sets the number of Concepts returned
+
+    :return: A JSON list of the matching Concepts' vocab_id, uri, prefLabel and the label & property that matched
+    :rtype: :class:`flask.Response`
+    """
+    query = request.values.get('q')
+    if query is None:
+        return Response(
+            'A Query String Argument \'q\' must be supplied for this endpoint, the text to complete',
+            status=400,
+            mimetype='text/plain'
+        )
+    try:
+        limit = int(request.values.get('limit')) if request.values.get('limit') is not None else None
+    except ValueError:
+        return Response('The Query String Argument \'limit\' must be a number', status=400, mimetype='text/plain')
+
+    return Response(
+        json.dumps(VOCAB_INDEX.labels.search(query, limit)),
+        mimetype='application/json'
+    )
+
+
 @routes.route('/geosciml')
 def geosciml():
     return render_template(
@@ -0,0 +1,178 @@
+import _config as config
+import data.source as source
+import logging
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from data.source._source import Source
+
+# the maximum number of vocabs whose labels are listed at once when building the label index
+if hasattr(config, 'LABEL_INDEX_WORKERS'):
+    INDEX_WORKERS = config.LABEL_INDEX_WORKERS
+else:
+    INDEX_WORKERS = 8
+
+# the number of Concepts a search finds unless asked for more, and the most it will find
+if hasattr(config, 'LABEL_SEARCH_LIMIT'):
+    SEARCH_LIMIT = config.LABEL_SEARCH_LIMIT
+else:
+    SEARCH_LIMIT = 10
+
+if hasattr(config, 'LABEL_SEARCH_MAX_LIMIT'):
+    SEARCH_MAX_LIMIT = config.LABEL_SEARCH_MAX_LIMIT
+else:
+    SEARCH_MAX_LIMIT = 100
+
+TOKEN = re.compile(r'\w+')
+
+# terms up to this long have the labels of every token they start ranked when the index is built, longer terms cover
+# few enough tokens for their labels to be merged when searching
+RANKED_PREFIX_LENGTH = 3
+
+
+def fold(text):
+    """
+    Folds text for matching: accents stripped, then casefolded, so 'Éclair' and 'eclair' are the same
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokens(text):
+    return TOKEN.findall(fold(text))
+
+
+class LabelIndex:
+    """
+    A read-only, in-memory index of the prefLabel, altLabel and hiddenLabel of every Concept in every vocab, for finding
+    Concepts without knowing their vocab
+
+    Labels are numbered in the order they are preferred as matches: prefLabels first, then shortest first. Each label
+    is split into folded tokens and the distinct tokens are kept sorted, so the tokens starting with a prefix are a
+    contiguous range found by binary search, each with its labels in number order. A search visits the labels of a
+    term's tokens best first, merging the tokens' labels, or reading them from the ranking made for every short prefix
+    when the index was built, and stops as soon as it has enough.
+    """
+    # label properties in the order their labels are preferred as matches
+    PROPERTIES = tuple(str(p) for p in Source.LABEL_PROPERTIES)
+
+    def __init__(self, labels):
+        """
+        :param labels: iterable of tuple(vocab ID, Concept URI, label property URI, label)
+        """
+        labels = sorted(
+            set(labels),
+            key=lambda l: (LabelIndex.PROPERTIES.index(l[2]) if l[2] in LabelIndex.PROPERTIES else 3, len(l[3]), l)
+        )
+        concept_ids = {}
+        self.concepts = []  # [vocab ID, Concept URI, prefLabel]
+        self.labels = []  # (concept ID, label property URI, label, label tokens each preceded by a space)
+        postings = []
+        for vocab_id, uri, p, label in labels:
+            concept_id = concept_ids.get((vocab_id, uri))
+            if concept_id is None:
+                concept_id = concept_ids[(vocab_id, uri)] = len(self.concepts)
+                self.concepts.append([vocab_id, uri, None])
+            if p == LabelIndex.PROPERTIES[0] and self.concepts[concept_id][2] is None:
+                self.concepts[concept_id][2] = label
+            label_tokens = set(tokens(label))
+            postings.extend((token, len(self.labels)) for token in label_tokens)
+            # so a token starting with a term is found by looking for ' ' + term in one string
+            self.labels.append((concept_id, p, label, ''.join(' ' + token for token in label_tokens)))
+        postings.sort()
+        self.postings = array('I', (label_id for token, label_id in postings))
+        self.tokens = []  # the distinct tokens, sorted
+        self.starts = array('I')  # where each token's labels start in postings, and where the last one's end
+        for position, (token, label_id) in enumerate(postings):
+            if not self.tokens or self.tokens[-1] != token:
+                self.tokens.append(token)
+                self.starts.append(position)
+        self.starts.append(len(postings))
+
+        ranked = {}
+        for token, label_id in postings:
+            for length in range(1, min(len(token), RANKED_PREFIX_LENGTH) + 1):
+                ranked.setdefault(token[:length], set()).add(label_id)
+        self.ranked = {prefix: array('I', sorted(label_ids)) for prefix, label_ids in ranked.items()}
+
+    @staticmethod
+    def build(vocabs):
+        """
+        Builds the label index of a vocab index, listing each vocab's labels with its source's list_labels()
+        :param vocabs: vocab IDs mapped to their Vocabulary objects
+        :return: the label index
+        :rtype: LabelIndex
+        """
+        def list_labels(vocab):
+            try:
+                return getattr(source, vocab.data_source or '', Source).list_labels(vocab)
+            except Exception as e:
+                logging.error('Unable to list the labels of vocab {}: {}'.format(vocab.id, e))
+                return []
+
+        labels = []
+        with ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix='label-index') as executor:
+            for vocab_id, vocab_labels in zip(vocabs, executor.map(list_labels, vocabs.values())):
+                labels.extend((vocab_id, uri, p, label) for uri, p, label in vocab_labels)
+        return LabelIndex(labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def prefixed(self, prefix):
+        """
+        Finds the tokens that start with a (folded) prefix
+        :return: the range of their positions in the token array
+        :rtype: range
+        """
+        return range(bisect_left(self.tokens, prefix), bisect_left(self.tokens, prefix + '\U0010ffff'))
+
+    def _postings(self, tokens):
+        # the number of labels of a range of tokens, counting a label once for each of its tokens
+        return self.starts[tokens.stop] - self.starts[tokens.start] if tokens else 0
+
+    def _label_ids(self, term, tokens):
+        # the IDs of the labels with a token starting with the term, best first
+        if len(term) <= RANKED_PREFIX_LENGTH:
+            return iter(self.ranked.get(term, ()))
+        return heapq.merge(*(self.postings[self.starts[t]:self.starts[t + 1]] for t in tokens))
+
+    def search(self, query, limit=None):
+        """
+        Finds Concepts with a label that has a token starting with each of the query's words, ignoring case and accents,
+        as people type them
+        :param query: the text typed so far
+        :param limit: the maximum number of Concepts to find, SEARCH_LIMIT if None, never more than SEARCH_MAX_LIMIT
+        :return: list of match dicts with the Concept's 'vocab_id', 'uri' & 'prefLabel' and the matching 'label' and
+        its 'property'
+        :rtype: list
+        """
+        limit = min(SEARCH_LIMIT if limit is None else limit, SEARCH_MAX_LIMIT)
+        terms = tokens(query)
+        if not terms or limit < 1:
+            return []
+        # visit the narrowest term's labels, best first, checking each for the other terms
+        term, tokens_range = min(((term, self.prefixed(term)) for term in terms), key=lambda t: self._postings(t[1]))
+        starts = [' ' + term for term in terms]
+        matches = []
+        found = set()
+        for label_id in self._label_ids(term, tokens_range):
+            concept_id, p, label, label_tokens = self.labels[label_id]
+            if concept_id in found:
+                continue
+            if all(start in label_tokens for start in starts):
+                found.add(concept_id)
+                vocab_id, uri, pref_label = self.concepts[concept_id]
+                matches.append({
+                    'vocab_id': vocab_id,
+                    'uri': uri,
+                    'prefLabel': pref_label,
+                    'label': label,
+                    'property': p
+                })
+                if len(matches) >= limit:
+                    break
+        return matches
@@ -1,20 +1,52 @@
 from data.source._source import Source
+from data.source._graph_cache import GraphCache, GRAPH_CACHE
+from data.source._compact import CompactGraph
 from os.path import join
 import _config as config
-from rdflib import Graph, URIRef, RDF
-from rdflib.namespace import SKOS, DCTERMS, OWL
+from rdflib import Graph, URIRef, Literal, BNode, RDF
+from rdflib.namespace import SKOS, DCTERMS, OWL, RDFS
 import os
 import pickle
+import json
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from helper import APP_DIR
 
 
 global g # Flask globals
 
+# keep FILE vocabs as memory-mapped compact triple stores (vocab_files/<id>.cg) rather than pickled rdflib Graphs
+if hasattr(config, 'FILE_COMPACT_STORE'):
+    COMPACT_STORE = config.FILE_COMPACT_STORE
+else:
+    COMPACT_STORE = False
+
+# the maximum number of processes parsing vocab files at once
+if hasattr(config, 'FILE_PARSE_WORKERS'):
+    PARSE_WORKERS = config.FILE_PARSE_WORKERS
+else:
+    PARSE_WORKERS = os.cpu_count() or 1
+
+
 class PickleLoadException(Exception):
     pass
 
 
+def parse_to_pickle(file_path, file_format, pickle_path):
+    """
+    Parses a vocab file and pickles its graph, also writing it as a compact triple store if COMPACT_STORE is on. A
+    module-level function so it can run in another process
+    :return: nothing
+    """
+    g = Graph().parse(file_path, format=file_format)
+    tmp_path = '{}.{}.tmp'.format(pickle_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(g, f)
+    os.replace(tmp_path, pickle_path)
+    if COMPACT_STORE:
+        CompactGraph.write(g, FILE.compact_path(pickle_path))
+
+
 class FILE(Source):
     hierarchy = {}
 
@@ -25,68 +57,102 @@ class FILE(Source):
         'rdf': 'xml'
     }
 
+    # the record, in vocab_files/, of each vocab file's size, mtime and hash when it was last pickled
+    MANIFEST = 'manifest.json'
+
     def __init__(self, vocab_id, request, language=None):
         super().__init__(vocab_id, request, language)
         self.g = FILE.load_pickle_graph(vocab_id)
 
     @staticmethod
     def init():
-        # find all files in project_directory/vocab_files
-        for path, subdirs, files in os.walk(join(config.APP_DIR, 'vocab_files')):
+        """
+        Pickles each file in APP_DIR/vocab_files that is new or has changed since it was last pickled, as recorded in
+        the files' manifest
+        :return: the manifest's entries, keyed by file path within vocab_files, of the files that are pickled
+        :rtype: dict
+        """
+        vocab_files = join(config.APP_DIR, 'vocab_files')
+        manifest = FILE.read_manifest(vocab_files)
+        current = {}
+        to_parse = []
+        for path, subdirs, files in os.walk(vocab_files):
             for name in files:
                 if name.split('.')[-1] in FILE.MAPPER:
-                    # load file
                     file_path = os.path.join(path, name)
-                    file_format = FILE.MAPPER[name.split('.')[-1]]
-                    # load graph
-                    g = Graph().parse(file_path, format=file_format)
-                    file_name = name.split('.')[0]
-                    # pickle to directory/vocab_files/
-                    with open(join(path, file_name + '.p'), 'wb') as f:
-                        pickle.dump(g, f)
-                        f.close()
-
-        # Get register item metadata
-        for vocab_id in g.VOCABS:
-            if vocab_id in g.VOCABS:
-                if g.VOCABS[vocab_id]['source'] != config.VocabSource.FILE:
-                    continue
-                
-                # Creators
-                creators = []
-                g = FILE.load_pickle_graph(vocab_id)
-                for uri in g.subjects(RDF.type, SKOS.ConceptScheme):
-                    for creator in g.objects(uri, DCTERMS.creator):
-                        creators.append(str(creator))
-                    break
-                g.VOCABS[vocab_id]['creators'] = creators
-
-                # Date Created
-                created = None
-                # dct:created
-                for uri in g.subjects(RDF.type, SKOS.ConceptScheme):
-                    for date in g.objects(uri, DCTERMS.created):
-                        created = str(date)[:10]
-                if not created:
-                    # dct:date
-                    for uri in g.subjects(RDF.type, SKOS.ConceptScheme):
-                        for date in g.objects(uri, DCTERMS.date):
-                            created = str(date)[:10]
-                g.VOCABS[vocab_id]['created'] = created
-
-                # Date Modified
-                modified = None
-                for uri in g.subjects(RDF.type, SKOS.ConceptScheme):
-                    for date in g.objects(uri, DCTERMS.modified):
-                        modified = str(date)[:10]
-                g.VOCABS[vocab_id]['modified'] = modified
-
-                # Version
-                version = None
-                for uri in g.subjects(RDF.type, SKOS.ConceptScheme):
-                    for versionInfo in g.objects(uri, OWL.versionInfo):
-                        version = versionInfo
-                g.VOCABS[vocab_id]['version'] = version
+                    pickle_path = join(path, name.split('.')[0] + '.p')
+                    key = os.path.relpath(file_path, vocab_files)
+                    previous = manifest.get(key)
+                    entry = FILE.manifest_entry(file_path, previous)
+                    current[key] = entry
+                    if previous is None or previous['sha256'] != entry['sha256'] or not os.path.isfile(pickle_path) \
+                            or (COMPACT_STORE and not CompactGraph.is_current(FILE.compact_path(pickle_path))):
+                        to_parse.append((file_path, FILE.MAPPER[name.split('.')[-1]], pickle_path))
+
+        # parsing is CPU bound so spread the files over processes
+        if to_parse:
+            with ProcessPoolExecutor(max_workers=min(len(to_parse), PARSE_WORKERS)) as executor:
+                futures = {executor.submit(parse_to_pickle, *args): args[0] for args in to_parse}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error('Unable to parse vocab file {}: {}'.format(futures[future], e))
+                        del current[os.path.relpath(futures[future], vocab_files)]  # try again next time
+        FILE.write_manifest(vocab_files, current)
+
+        return current
+
+    @staticmethod
+    def collect(details):
+        """
+        For this source, each vocab file in APP_DIR/vocab_files is a vocab, its ID the file's name without extension.
+        New and changed files are parsed first, see init()
+
+        'files': {
+            'source': VocabSource.FILE
+        },
+        """
+        logging.debug('FILE collect()...')
+        vocabs = {}
+        for key in FILE.init():
+            vocab_id = os.path.basename(key).split('.')[0]
+            vocab = FILE.vocabulary(vocab_id)
+            if vocab is not None:
+                vocabs[vocab_id] = vocab
+        logging.debug('FILE collect() complete.')
+        return vocabs
+
+    @staticmethod
+    def vocabulary(vocab_id):
+        """
+        Makes a vocab's register item from its graph's ConceptScheme: its title, description, creator, dates (the
+        created date can also be a dct:date) and version
+        :return: the Vocabulary or None if the graph has no ConceptScheme
+        :rtype: Vocabulary
+        """
+        from model.vocabulary import Vocabulary
+
+        graph = FILE.load_pickle_graph(vocab_id)
+        if graph is None:
+            return None
+        for s in graph.subjects(RDF.type, SKOS.ConceptScheme):
+            title = graph.value(s, SKOS.prefLabel) or graph.value(s, DCTERMS.title) or graph.value(s, RDFS.label)
+            created = graph.value(s, DCTERMS.created) or graph.value(s, DCTERMS.date)
+            modified = graph.value(s, DCTERMS.modified)
+            return Vocabulary(
+                vocab_id,
+                str(s),
+                str(title) if title is not None else vocab_id,
+                graph.value(s, DCTERMS.description),
+                graph.value(s, DCTERMS.creator),
+                str(created)[:10] if created is not None else None,
+                str(modified)[:10] if modified is not None else None,
+                graph.value(s, OWL.versionInfo),
+                config.VocabSource.FILE,
+                str(s)
+            )
+        return None
 
     @classmethod
     def list_vocabularies(self):
@@ -116,57 +182,64 @@ class FILE(Source):
         return vocabs
 
     def list_collections(self):
-        q = '''
-            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT *
-            WHERE {
-              ?c a skos:Concept .
-              ?c rdfs:label ?l .
-            }'''
-        return [(x['c'], x['l']) for x in self.g.query(q)]
-
-    def list_concepts(self):
+        return [(c, l) for c in self.g.subjects(RDF.type, SKOS.Concept) for l in self.g.objects(c, RDFS.label)]
+
+    def titles(self, s):
+        """
+        Gets a resource's titles, preferring skos:prefLabel then dct:title then rdfs:label
+
+        :param s: the resource
+        :return: all the values of the first of those properties that it has
+        :rtype: list
+        """
+        for p in (SKOS.prefLabel, DCTERMS.title, RDFS.label):
+            titles = list(self.g.objects(s, p))
+            if titles:
+                return titles
+        return []
+
+    # the ways list_concepts() can be sorted, mapped to the row values they sort by
+    CONCEPT_SORTS = {
+        'title': 'title',
+        'created': 'created',
+        'modified': 'modified',
+    }
+
+    def concept_rows(self, search=None):
+        """
+        Gets one row per Concept and title, created & modified value, as a SPARQL query with OPTIONAL created and
+        modified would, read straight from the graph's indexes
+
+        :param search: only keep rows whose title contains this text, ignoring case
+        :return: list of row dicts with 's', 'title', 'created' & 'modified'
+        :rtype: list
+        """
+        search = search.lower() if search else None
+        rows = []
+        for s in self.g.subjects(RDF.type, SKOS.Concept):
+            titles = [t for t in self.titles(s) if search is None or search in str(t).lower()]
+            if not titles:
+                continue
+            createds = list(self.g.objects(s, DCTERMS.created)) or [None]
+            modifieds = list(self.g.objects(s, DCTERMS.modified)) or [None]
+            for title in titles:
+                for created in createds:
+                    for modified in modifieds:
+                        rows.append({'s': s, 'title': title, 'created': created, 'modified': modified})
+        return rows
+
+    def list_concepts(self, page=None, per_page=None, sort='title', search=None):
+        rows = self.concept_rows(search)
+
+        # unbound values sort first, as in SPARQL
+        key = self.CONCEPT_SORTS.get(sort, 'title')
+        rows.sort(key=lambda row: (row[key] is not None, str(row[key]) if row[key] is not None else '', str(row['s'])))
+        if page is not None and per_page is not None:
+            start = (max(int(page), 1) - 1) * int(per_page)
+            rows = rows[start:start + int(per_page)]
+
         vocabs = []
-        # for s, p, o in self.g.triples((None, SKOS.inScheme, None)):
-        #     label = ' '.join(str(s).split('#')[-1].split('/')[-1].split('_'))
-        #     vocabs.append({
-        #         'uri': str(s),
-        #         'title': label
-        #     })
-        result = self.g.query("""
-            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX dct: <http://purl.org/dc/terms/>
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT * 
-            WHERE {{
-                {{
-                    ?s a skos:Concept .
-                    ?s skos:prefLabel ?title .                    
-                }}
-                UNION
-                {{
-                    ?s a skos:Concept .
-                    ?s dct:title ?title . 
-                    MINUS { ?s skos:prefLabel ?prefLabel }
-                }}
-                UNION
-                {{
-                    ?s a skos:Concept .
-                    ?s rdfs:label ?title . 
-                    MINUS { ?s skos:prefLabel ?prefLabel }
-                    MINUS { ?s dct:title ?prefLabel }
-                }}
-                OPTIONAL {{
-                    ?s dct:created ?created .
-                }}
-                OPTIONAL {{
-                    ?s dct:modified ?modified .
-                }}
-            }}
-            """)
-
-        for row in result:
+        for row in rows:
             vocabs.append({
                 'vocab_id': self.vocab_id,
                 'uri': str(row['s']),
@@ -177,43 +250,24 @@ class FILE(Source):
 
         return vocabs
 
+    def count_concepts(self, search=None):
+        return len(self.concept_rows(search))
+
+    @staticmethod
+    def list_labels(vocab):
+        graph = FILE.load_pickle_graph(vocab.id)
+        if graph is None:
+            return []
+        labels = []
+        for p in Source.LABEL_PROPERTIES:
+            for c, _, l in graph.triples((None, p, None)):
+                if (c, RDF.type, SKOS.Concept) in graph:
+                    labels.append((str(c), str(p), str(l)))
+        return labels
+
     def get_vocabulary(self):
         from model.vocabulary import Vocabulary
 
-        result = self.g.query('''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX dct: <http://purl.org/dc/terms/>
-            PREFIX owl: <http://www.w3.org/2002/07/owl#>
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT DISTINCT ?s ?title ?description ?creator ?created ?modified ?version ?hasTopConcept ?topConceptLabel
-            WHERE {{
-                {{
-                    ?s a skos:ConceptScheme .
-                    ?s skos:prefLabel ?title .                    
-                }}
-                UNION
-                {{
-                    ?s a skos:ConceptScheme .
-                    ?s dct:title ?title . 
-                    MINUS {{ ?s skos:prefLabel ?prefLabel }}
-                }}
-                UNION
-                {{
-                    ?s a skos:ConceptScheme .
-                    ?s rdfs:label ?title . 
-                    MINUS {{ ?s skos:prefLabel ?prefLabel }}
-                    MINUS {{ ?s dct:title ?prefLabel }}
-                }}
-                OPTIONAL {{ ?s dct:description ?description }}
-                OPTIONAL {{ ?s dct:creator ?creator }}
-                OPTIONAL {{ ?s dct:created ?created }}
-                OPTIONAL {{ ?s dct:modified ?modified }}
-                OPTIONAL {{ ?s owl:versionInfo ?version }}
-                OPTIONAL {{ 
-                    ?s skos:hasTopConcept ?hasTopConcept .
-                    ?hasTopConcept skos:prefLabel ?topConceptLabel .
-              }}
-            }}''')
-
         title = None
         description = None
         creator = None
@@ -223,22 +277,26 @@ class FILE(Source):
 
         topConcepts = []
 
-        for r in result:
-            self.uri = str(r['s'])
+        for s in self.g.subjects(RDF.type, SKOS.ConceptScheme):
+            titles = self.titles(s)
+            if not titles:
+                continue
+            self.uri = str(s)
             if title is None:
-                title = r['title']
+                title = titles[0]
             if description is None:
-                description = r['description']
+                description = self.g.value(s, DCTERMS.description)
             if creator is None:
-                creator = r['creator']
+                creator = self.g.value(s, DCTERMS.creator)
             if created is None:
-                created = r['created']
+                created = self.g.value(s, DCTERMS.created)
             if modified is None:
-                modified = r['modified']
+                modified = self.g.value(s, DCTERMS.modified)
             if version is None:
-                version = r['version']
-            if r['hasTopConcept'] and r['topConceptLabel'] is not None:
-                topConcepts.append((r['hasTopConcept'], r['topConceptLabel']))
+                version = self.g.value(s, OWL.versionInfo)
+            for tc in self.g.objects(s, SKOS.hasTopConcept):
+                for label in self.g.objects(tc, SKOS.prefLabel):
+                    topConcepts.append((tc, label))
 
         v = Vocabulary(
             self.vocab_id,
@@ -249,7 +307,9 @@ class FILE(Source):
             created,
             modified,
             version,
-            topConcepts
+            config.VocabSource.FILE,
+            self.uri,
+            hasTopConcept=topConcepts
         )
 
         # sort the top concepts by prefLabel
@@ -259,85 +319,97 @@ class FILE(Source):
         v.conceptHierarchy = self.get_concept_hierarchy()
         return v
 
-    def get_collection(self, uri):
-        pass
+    # the properties of Source's describe query, and those whose values are kept whatever their language
+    DESCRIBED = (
+        RDF.type,
+        SKOS.prefLabel, SKOS.definition, SKOS.altLabel, SKOS.hiddenLabel, DCTERMS.source, DCTERMS.contributor,
+        DCTERMS.created, DCTERMS.modified,
+        SKOS.broader, SKOS.narrower,
+        SKOS.exactMatch, SKOS.closeMatch, SKOS.broadMatch, SKOS.narrowMatch, SKOS.relatedMatch,
+        RDFS.label, RDFS.comment, SKOS.member
+    )
+    ALL_LANGUAGES = (
+        RDF.type, SKOS.prefLabel, SKOS.broader, SKOS.narrower, SKOS.exactMatch, SKOS.closeMatch, SKOS.broadMatch,
+        SKOS.narrowMatch, SKOS.relatedMatch, SKOS.member
+    )
+
+    def _describe(self, uri):
+        # the rows of Source's describe query, read straight from the graph
+        if self.g is None:
+            return []
+        rows = []
+        for p in FILE.DESCRIBED:
+            for o in self.g.objects(URIRef(uri), p):
+                if p not in FILE.ALL_LANGUAGES and not self.in_language(o):
+                    continue
+                row = {'p': FILE.term_json(p), 'o': FILE.term_json(o)}
+                labels = [l for l in self.g.objects(o, SKOS.prefLabel) if self.in_language(l)] \
+                    if not isinstance(o, Literal) else []
+                if not labels:
+                    rows.append(row)
+                for label in labels:
+                    rows.append(dict(row, label=FILE.term_json(label)))
+        return rows
+
+    def in_language(self, o):
+        # as SPARQL's lang(?o) = "<language>" || lang(?o) = "", which is false for IRIs
+        return isinstance(o, Literal) and (o.language or '') in (self.language, '')
+
+    @staticmethod
+    def term_json(term):
+        if isinstance(term, Literal):
+            value = {'type': 'literal', 'value': str(term)}
+            if term.language:
+                value['xml:lang'] = term.language
+            elif term.datatype:
+                value['datatype'] = str(term.datatype)
+            return value
+        return {'type': 'bnode' if isinstance(term, BNode) else 'uri', 'value': str(term)}
 
     def get_concept_hierarchy(self):
-        # return FILE.hierarchy[self.vocab_id]
-        pass
-        g = FILE.load_pickle_graph(self.vocab_id)
-        result = g.query(
-            """
-            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-
-            SELECT (COUNT(?mid) AS ?length) ?c ?pl ?parent
-            WHERE {{ 
-                ?c      a                                       skos:Concept .   
-                ?cs     (skos:hasTopConcept | skos:narrower)*   ?mid .
-                ?mid    (skos:hasTopConcept | skos:narrower)+   ?c .                      
-                ?c      skos:prefLabel                          ?pl .
-                ?c		(skos:topConceptOf | skos:broader)		?parent .
-                FILTER (?cs = <{}>)
-            }}
-            GROUP BY ?c ?pl ?parent
-            ORDER BY ?length ?parent ?pl
-            """.format(self.uri)
-        )
+        # the rows of a hierarchy query, worked out from the graph's hasTopConcept & narrower links. A Concept's length
+        # is the number of resources from the ConceptScheme down to its parent that lie on a path to it
+        cs_uri = URIRef(self.uri)
+        downward = (SKOS.hasTopConcept, SKOS.narrower)
+
+        # everything under the ConceptScheme, and the ConceptScheme
+        reachable = {cs_uri}
+        stack = [cs_uri]
+        while stack:
+            node = stack.pop()
+            for p in downward:
+                for o in self.g.objects(node, p):
+                    if o not in reachable:
+                        reachable.add(o)
+                        stack.append(o)
 
         cs = []
-        for row in result:
-            cs.append({
-                'length': {'value': row['length']},
-                'c': {'value': row['c']},
-                'pl': {'value': row['pl']},
-                'parent': {'value': row['parent']}
-            })
-
-        hierarchy = []
-        previous_parent_uri = None
-        last_index = 0
-
-        for c in cs:
-            # insert all topConceptOf directly
-            if str(c['parent']['value']) == self.uri:
-                hierarchy.append((
-                    int(c['length']['value']),
-                    c['c']['value'],
-                    c['pl']['value'],
-                    None
-                ))
-            else:
-                # If this is not a topConcept, see if it has the same URI as the previous inserted Concept
-                # If so, use that Concept's index + 1
-                this_parent = c['parent']['value']
-                if this_parent == previous_parent_uri:
-                    # use last inserted index
-                    hierarchy.insert(last_index + 1, (
-                        int(c['length']['value']),
-                        c['c']['value'],
-                        c['pl']['value'],
-                        c['parent']['value']
-                    ))
-                    last_index += 1
-                # This is not a TopConcept and it has a differnt parent from the previous insert
-                # So insert it after it's parent
-                else:
-                    i = 0
-                    parent_index = 0
-                    for t in hierarchy:
-                        if this_parent in t[1]:
-                            parent_index = i
-                        i += 1
-
-                    hierarchy.insert(parent_index + 1, (
-                        int(c['length']['value']),
-                        c['c']['value'],
-                        c['pl']['value'],
-                        c['parent']['value']
-                    ))
-
-                    last_index = parent_index + 1
-                previous_parent_uri = this_parent
+        for c in reachable:
+            if (c, RDF.type, SKOS.Concept) not in self.g:
+                continue
+            # the resources above this Concept that are also under the ConceptScheme
+            above = set()
+            stack = [c]
+            while stack:
+                node = stack.pop()
+                for p in downward:
+                    for s in self.g.subjects(p, node):
+                        if s not in above and s in reachable:
+                            above.add(s)
+                            stack.append(s)
+            if not above:
+                continue
+            for pl in self.g.objects(c, SKOS.prefLabel):
+                for parent in set(self.g.objects(c, SKOS.topConceptOf)) | set(self.g.objects(c, SKOS.broader)):
+                    cs.append({
+                        'length': {'value': len(above)},
+                        'c': {'value': c},
+                        'pl': {'value': pl},
+                        'parent': {'value': parent}
+                    })
+        cs.sort(key=lambda row: (row['length']['value'], str(row['parent']['value']), str(row['pl']['value'])))
+
+        hierarchy = Source.order_concept_hierarchy(cs, self.uri)
         return Source.draw_concept_hierarchy(hierarchy, self.request, self.vocab_id)
 
     @staticmethod
@@ -365,25 +437,69 @@ class FILE(Source):
             raise Exception('topConcept not found')
 
     def get_object_class(self, uri):
-        if g.VOCABS[self.vocab_id].get('turtle'):
-            g = Graph().parse(g.VOCABS[self.vocab_id]['turtle'], format='turtle')
-        else:
-            g = Graph().parse(os.path.join(APP_DIR, 'vocab_files', self.vocab_id + '.ttl'), format='turtle')
-        for s, p, o in g.triples((URIRef(uri), RDF.type, SKOS.Concept)):
+        # look the class up in the vocab's already parsed graph rather than re-parsing its file
+        g = self.g
+        for s, p, o in g.triples((URIRef(uri), RDF.type, None)):
+            if str(o) in Source.VOC_TYPES:
                 return str(o)
+        return None
 
     @staticmethod
     def load_pickle_graph(vocab_id):
+        # unpickled, or memory-mapped, once per process and then shared, until the file changes
         pickled_file_path = os.path.join(config.APP_DIR, 'vocab_files', vocab_id + '.p')
 
         try:
-            with open(pickled_file_path, 'rb') as f:
-                g = pickle.load(f)
-                f.close()
-                return g
+            # a store in an older format is used as its pickle until init() rewrites it
+            if COMPACT_STORE and CompactGraph.is_current(FILE.compact_path(pickled_file_path)):
+                return GRAPH_CACHE.get(vocab_id, FILE.compact_path(pickled_file_path), CompactGraph)
+            return GRAPH_CACHE.get(vocab_id, pickled_file_path)
         except Exception:
             return None
 
+    @staticmethod
+    def compact_path(pickle_path):
+        return pickle_path[:-len('.p')] + '.cg'
+
+    @staticmethod
+    def read_manifest(vocab_files):
+        """
+        Reads the record of the vocab files as they were when they were last pickled
+        :param vocab_files: the vocab files' directory
+        :return: vocab file paths, relative to vocab_files, mapped to their size, mtime and sha256
+        :rtype: dict
+        """
+        try:
+            with open(join(vocab_files, FILE.MANIFEST), 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    @staticmethod
+    def write_manifest(vocab_files, manifest):
+        tmp_path = join(vocab_files, '{}.{}.tmp'.format(FILE.MANIFEST, os.getpid()))
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, join(vocab_files, FILE.MANIFEST))
+
+    @staticmethod
+    def manifest_entry(file_path, previous=None):
+        """
+        Describes a vocab file for the manifest. The file is only hashed if its size or mtime differ from previous
+        :param file_path: the vocab file
+        :param previous: the file's entry from the manifest, if any
+        :return: the file's size, mtime and sha256
+        :rtype: dict
+        """
+        stat = os.stat(file_path)
+        if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+            return previous
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': GraphCache.digest(file_path)
+        }
+
     @staticmethod
     def pickle_to_file(vocab_id, g):
         logging.debug('Pickling file: {}'.format(vocab_id))
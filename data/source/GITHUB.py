@@ -2,6 +2,41 @@ from data.source._source import Source
 from os.path import dirname, realpath, join, abspath
 import _config as config
 from rdflib import Graph
+from data.source._prepared import PREPARED_QUERIES
+
+PREPARED_QUERIES.register('github_collections', '''
+    SELECT *
+    WHERE {
+      ?c a skos:Concept .
+      ?c rdfs:label ?l .
+    }''')
+
+PREPARED_QUERIES.register('github_concepts', '''
+    SELECT *
+    WHERE {
+      ?c a skos:Concept .
+      ?c skos:prefLabel ?pl .
+    }''')
+
+PREPARED_QUERIES.register('github_vocabulary', '''
+    SELECT *
+    WHERE {
+      ?s a skos:ConceptScheme ;
+      dct:title ?t ;
+      dct:description ?d .
+      OPTIONAL {?s dct:creator ?c }
+      OPTIONAL {?s dct:created ?cr }
+      OPTIONAL {?s dct:modified ?m }
+      OPTIONAL {?s owl:versionInfo ?v }
+    }''')
+
+# bind ?s to the ConceptScheme
+PREPARED_QUERIES.register('github_top_concepts', '''
+    SELECT *
+    WHERE {
+      ?s skos:hasTopConcept ?tc .
+      ?tc skos:prefLabel ?pl .
+    }''')
 
 
 # TODO: implement GITHUB source
@@ -19,42 +54,15 @@ class GITHUB(Source):
         return NotImplementedError
 
     def list_collections(self):
-        q = '''
-            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT *
-            WHERE {
-              ?c a skos:Concept .
-              ?c rdfs:label ?l .
-            }'''
-        return [(x['c'], x['l']) for x in self.g.query(q)]
+        return [(x['c'], x['l']) for x in PREPARED_QUERIES.query(self.g, 'github_collections')]
 
     def list_concepts(self):
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {
-              ?c a skos:Concept .
-              ?c skos:prefLabel ?pl .
-            }'''
-        return [(x['c'], x['pl']) for x in self.g.query(q)]
+        return [(x['c'], x['pl']) for x in PREPARED_QUERIES.query(self.g, 'github_concepts')]
 
     def get_vocabulary(self):
         from model.vocabulary import Vocabulary
 
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX dct: <http://purl.org/dc/terms/>
-            PREFIX owl: <http://www.w3.org/2002/07/owl#>
-            SELECT *
-            WHERE {
-              ?s a skos:ConceptScheme ;
-              dct:title ?t ;
-              dct:description ?d .
-              OPTIONAL {?s dct:creator ?c }
-              OPTIONAL {?s dct:created ?cr }
-              OPTIONAL {?s dct:modified ?m }
-              OPTIONAL {?s owl:versionInfo ?v }
-            }'''
-        for r in self.g.query(q):
+        for r in PREPARED_QUERIES.query(self.g, 'github_vocabulary'):
             v = Vocabulary(
                 self.vocab_id,
                 r['s'],
@@ -69,14 +77,8 @@ class GITHUB(Source):
                 None
             )
 
-        q2 = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {
-              ?s skos:hasTopConcept ?tc .
-              ?tc skos:prefLabel ?pl .
-            }'''
         # add the top concepts to the Vocabulary class instance
-        v.hasTopConcepts = [(x['tc'], x['pl']) for x in self.g.query(q2)]
+        v.hasTopConcepts = [(x['tc'], x['pl']) for x in PREPARED_QUERIES.query(self.g, 'github_top_concepts', s=v.uri)]
         # sort the top concepts by prefLabel
         v.hasTopConcepts.sort(key=lambda tup: tup[1])
         return v
@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+from os.path import join
+import _config as config
+from data.source._source import Source
+from data.source._transport import SparqlTransport
+from data.source._cache import QUERY_CACHE
+from data.source.FILE import FILE
+from data.source.SPARQL import SPARQL
+
+# pyoxigraph is only needed if an OXIGRAPH vocab source is configured
+try:
+    import pyoxigraph
+except ImportError:
+    pyoxigraph = None
+
+
+class OxigraphTransport:
+    """
+    Runs SPARQL queries against an embedded, on-disk Oxigraph store, returning SPARQL JSON results as an HTTP
+    endpoint would
+
+    Registered for 'oxigraph:<store directory>' endpoints so that Source's queries run against the store unchanged.
+    Only one process can open a store. To serve vocabs from several processes, load the store in one process (e.g.
+    `oxigraph serve`) and have VocPrez query it as a SPARQL source.
+    """
+    def __init__(self, endpoint):
+        if pyoxigraph is None:
+            raise ImportError('The OXIGRAPH vocab source needs pyoxigraph, install it with: pip install pyoxigraph')
+        self.endpoint = endpoint
+        self.path = endpoint.split(':', 1)[1]
+        self.lock = threading.Lock()  # held while loading
+        try:
+            self.store = pyoxigraph.Store(self.path)
+        except OSError as e:
+            # a read-only view of a store another process writes to is undefined behaviour in Oxigraph and would never
+            # see its reloads, so there is no falling back to one
+            raise OSError(
+                'Oxigraph store {} is in use by another process. Run a single VocPrez process for an OXIGRAPH source, '
+                'or serve the store with one Oxigraph server and configure it as a SPARQL source: {}'.format(self.path, e)
+            )
+
+    def query(self, q, username=None, password=None):
+        """
+        Runs a SPARQL query against the store
+        :param q: the SPARQL query
+        :param username: unused, the store is local
+        :param password: unused, the store is local
+        :return: the SPARQL JSON results
+        :rtype: dict
+        """
+        results = self.store.query(q)
+        if isinstance(results, pyoxigraph.QueryBoolean):
+            return {'head': {}, 'boolean': bool(results)}
+        variables = [v.value for v in results.variables]
+        bindings = []
+        for solution in results:
+            binding = {}
+            for variable in variables:
+                term = solution[variable]
+                if term is not None:
+                    binding[variable] = OxigraphTransport.term_json(term)
+            bindings.append(binding)
+        return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+
+    @staticmethod
+    def term_json(term):
+        if isinstance(term, pyoxigraph.NamedNode):
+            return {'type': 'uri', 'value': term.value}
+        elif isinstance(term, pyoxigraph.BlankNode):
+            return {'type': 'bnode', 'value': term.value}
+        value = {'type': 'literal', 'value': term.value}
+        if term.language:
+            value['xml:lang'] = term.language
+        elif term.datatype.value != 'http://www.w3.org/2001/XMLSchema#string':
+            value['datatype'] = term.datatype.value
+        return value
+
+
+SparqlTransport.SCHEMES['oxigraph'] = OxigraphTransport
+
+
+class OXIGRAPH(Source):
+    """Source for vocab files loaded into an embedded, on-disk Oxigraph store
+
+    The store is queried with the same SPARQL as a remote endpoint. Each file is loaded into its own named graph and only
+    reloaded when it changes, so the store's indexes persist between restarts.
+    """
+    # file extensions mapped to the formats Oxigraph loads them as
+    FORMATS = {
+        'ttl': 'TURTLE',
+        'rdf': 'RDF_XML',
+        'nt': 'N_TRIPLES',
+        'trig': 'TRIG',
+        'jsonld': 'JSON_LD',
+    }
+
+    def __init__(self, vocab_id, request, language=None):
+        super().__init__(vocab_id, request, language)
+
+    @staticmethod
+    def collect(details):
+        """
+        For this source, a directory of vocab files is loaded into a store and each ConceptScheme in it is a vocab
+
+        'local': {
+            'source': VocabSource.OXIGRAPH,
+            'store_path': '/var/lib/vocprez/oxigraph',
+            'vocab_files': '/var/lib/vocprez/vocab_files'  # optional, defaults to APP_DIR/vocab_files
+        },
+        """
+        logging.debug('OXIGRAPH collect()...')
+        endpoint = 'oxigraph:' + details['store_path']
+        OXIGRAPH.load(
+            SparqlTransport.for_endpoint(endpoint),
+            details.get('vocab_files') or join(config.APP_DIR, 'vocab_files')
+        )
+
+        vocabs = SPARQL.collect({
+            'sparql_endpoint': endpoint,
+            'sparql_username': None,
+            'sparql_password': None,
+            'uri_filter_regex': details.get('uri_filter_regex')
+        })
+        for vocab in vocabs.values():
+            vocab.data_source = config.VocabSource.OXIGRAPH
+        logging.debug('OXIGRAPH collect() complete.')
+        return vocabs
+
+    @staticmethod
+    def load(transport, vocab_files):
+        """
+        Loads new and changed vocab files into the store, each into a named graph of its file URI, and removes the
+        graphs of deleted files. What was loaded is kept in a manifest in the store's directory
+        :param transport: the store's OxigraphTransport
+        :param vocab_files: the vocab files' directory
+        :return: nothing
+        """
+        with transport.lock:
+            manifest = FILE.read_manifest(transport.path)
+            current = {}
+            changed = False
+            for path, subdirs, files in os.walk(vocab_files):
+                for name in files:
+                    extension = name.split('.')[-1]
+                    if extension not in OXIGRAPH.FORMATS:
+                        continue
+                    file_path = os.path.join(path, name)
+                    key = os.path.relpath(file_path, vocab_files)
+                    previous = manifest.get(key)
+                    entry = FILE.manifest_entry(file_path, previous)
+                    if previous is None or previous['sha256'] != entry['sha256']:
+                        graph = pyoxigraph.NamedNode('file:///' + key.replace(os.sep, '/'))
+                        try:
+                            transport.store.remove_graph(graph)
+                        except Exception:
+                            pass  # not loaded before
+                        try:
+                            transport.store.bulk_load(
+                                path=file_path,
+                                format=getattr(pyoxigraph.RdfFormat, OXIGRAPH.FORMATS[extension]),
+                                to_graph=graph
+                            )
+                        except Exception as e:
+                            logging.error('Unable to load vocab file {}: {}'.format(file_path, e))
+                            continue  # try again next time
+                        changed = True
+                    current[key] = entry
+
+            for key in set(manifest) - set(current):
+                transport.store.remove_graph(pyoxigraph.NamedNode('file:///' + key.replace(os.sep, '/')))
+                changed = True
+
+            if changed:
+                transport.store.flush()
+                QUERY_CACHE.clear()
+            FILE.write_manifest(transport.path, current)
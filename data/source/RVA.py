@@ -1,12 +1,18 @@
 import logging
-import requests
 import json
 import dateutil.parser
-from flask import g
+from concurrent.futures import ThreadPoolExecutor
 from data.source._source import Source
+from data.source._documents import DOCUMENT_CACHE
 from model.vocabulary import Vocabulary
 import _config as config
 
+# the maximum number of RVA registry lookups made at once
+if hasattr(config, 'RVA_COLLECT_WORKERS'):
+    COLLECT_WORKERS = config.RVA_COLLECT_WORKERS
+else:
+    COLLECT_WORKERS = 8
+
 
 class RVA(Source):
     """Source for Research Vocabularies Australia
@@ -40,31 +46,41 @@ class RVA(Source):
         }
         """
 
-        # Get the details for each vocab from the RVA catalogue API
+        # Get the details for each vocab from the RVA catalogue API, all at once. Each response is kept with its
+        # validators so vocabs that haven't changed since the last collect() aren't downloaded again
         logging.debug('RVA collect()...')
-        rva_vocabs = {}
-        for vocab in details['vocabs']:
-            r = requests.get(
+        workers = max(min(len(details['vocabs']), COLLECT_WORKERS), 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rva-collect') as executor:
+            futures = [
+                (vocab, executor.submit(
+                    DOCUMENT_CACHE.get,
                     details['api_endpoint'].format(vocab['ardc_id']),
-                    headers={'Accept': 'application/json'}
+                    {'Accept': 'application/json'},
+                    0
+                ))
+                for vocab in details['vocabs']
+            ]
+
+        rva_vocabs = {}
+        for vocab, future in futures:
+            try:
+                j = json.loads(future.result().decode('utf-8'))
+            except Exception as e:
+                logging.error('Could not get vocab {} from RVA: {}'.format(vocab['ardc_id'], e))
+                continue
+            vocab_id = 'rva-' + str(vocab['ardc_id'])
+            rva_vocabs[vocab_id] = Vocabulary(
+                vocab_id,
+                vocab['uri'],
+                j['title'],
+                j.get('description'),
+                j.get('creator'),
+                dateutil.parser.parse(j.get('creation-date')),
+                None,
+                j['version'][0]['title'],
+                config.VocabSource.RVA,
+                vocab['uri'],
+                sparql_endpoint=j['version'][0]['access-point'][0]['ap-api-sparql']['url']
             )
-            if r.status_code == 200:
-                j = json.loads(r.text)
-                vocab_id = 'rva-' + str(vocab['ardc_id'])
-                rva_vocabs[vocab_id] = Vocabulary(
-                    vocab_id,
-                    vocab['uri'],
-                    j['title'],
-                    j.get('description'),
-                    j.get('creator'),
-                    dateutil.parser.parse(j.get('creation-date')),
-                    None,
-                    j['version'][0]['title'],
-                    config.VocabSource.RVA,
-                    vocab['uri'],
-                    sparql_endpoint=j['version'][0]['access-point'][0]['ap-api-sparql']['url']
-                )
-            else:
-                logging.error('Could not get vocab {} from RVA'.format(vocab['ardc_id']))
-        g.VOCABS = {**g.VOCABS, **rva_vocabs}
         logging.debug('RVA collect() complete')
+        return rva_vocabs
@@ -1,6 +1,5 @@
 import logging
 import dateutil.parser
-from flask import g
 from data.source._source import Source
 from model.vocabulary import Vocabulary
 import _config as config
@@ -86,5 +85,5 @@ class SPARQL(Source):
                 sparql_username=details['sparql_username'],
                 sparql_password=details['sparql_password']
             )
-        g.VOCABS = {**g.VOCABS, **sparql_vocabs}
         logging.debug('SPARQL collect() complete.')
+        return sparql_vocabs
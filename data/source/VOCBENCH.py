@@ -4,8 +4,12 @@ import json
 import _config as config
 from rdflib import Graph, Literal, URIRef
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
 from helper import APP_DIR
-from vocbench import Vocbench
+from data.source.FILE import parse_to_pickle
 
 global g # Flask globals
 
@@ -17,21 +21,132 @@ class VbException(Exception):
     pass
 
 
+# the maximum number of idle logged-in sessions kept, and seconds before a session is logged in again
+if hasattr(config, 'VB_SESSION_POOL_SIZE'):
+    SESSION_POOL_SIZE = config.VB_SESSION_POOL_SIZE
+else:
+    SESSION_POOL_SIZE = 10
+
+if hasattr(config, 'VB_SESSION_MAX_AGE'):
+    SESSION_MAX_AGE = config.VB_SESSION_MAX_AGE
+else:
+    SESSION_MAX_AGE = 1800
+
+# bytes of a project export written at a time, and checkpointed, when harvesting
+if hasattr(config, 'VB_HARVEST_CHUNK_SIZE'):
+    HARVEST_CHUNK_SIZE = config.VB_HARVEST_CHUNK_SIZE
+else:
+    HARVEST_CHUNK_SIZE = 1024 * 1024
+
+# seconds to wait for VocBench to connect and then between parts of an export
+if hasattr(config, 'VB_HARVEST_TIMEOUT'):
+    HARVEST_TIMEOUT = config.VB_HARVEST_TIMEOUT
+else:
+    HARVEST_TIMEOUT = (10, 300)
+
+
+class VbSessionPool:
+    """
+    A thread-safe pool of sessions logged in to VocBench, shared by all requests
+
+    Each request borrows an idle session, or logs a new one in, and gives it back once its response has been read. A
+    session is logged in again when it is older than max_age or VocBench answers 401, and the request is then repeated
+    once. Streamed responses are read within stream(), which only gives the session back when the response is closed.
+    """
+    def __init__(self, endpoint, user, password, size, max_age):
+        self.endpoint = endpoint
+        self.user = user
+        self.password = password
+        self.size = size
+        self.max_age = max_age
+        self._idle = []  # (session, time logged in)
+        self._lock = threading.Lock()
+
+    def login(self, s=None):
+        s = s or requests.session()
+        s.cookies.clear()
+        r = s.post(
+            self.endpoint + '/Auth/login',
+            data={
+                'email': self.user,
+                'password': self.password
+            }
+        )
+        if r.status_code == 200:
+            return s, time.time()
+        else:
+            raise VbAuthException('Not able to log in. Error from VB is: ' + r.content.decode('utf-8'))
+
+    def _acquire(self):
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None or time.time() - session[1] > self.max_age:
+            session = self.login(session[0] if session else None)
+        return session
+
+    def _release(self, session):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(session)
+
+    def _send(self, session, method, url, **kwargs):
+        r = session[0].request(method, url, **kwargs)
+        if r.status_code == 401:
+            r.close()
+            session = self.login(session[0])
+            r = session[0].request(method, url, **kwargs)
+        return session, r
+
+    def request(self, method, url, **kwargs):
+        # the whole response is read before returning, so the session is free again
+        session, r = self._send(self._acquire(), method, url, **kwargs)
+        self._release(session)
+        return r
+
+    @contextmanager
+    def stream(self, method, url, **kwargs):
+        """
+        Makes a streamed request, keeping its session out of the pool until the response has been read and closed
+        :return: a context manager for the response
+        """
+        session = self._acquire()
+        r = None
+        try:
+            session, r = self._send(session, method, url, stream=True, **kwargs)
+            yield r
+        finally:
+            if r is not None:
+                r.close()
+            self._release(session)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
 class VOCBENCH(Source):
+    sessions = VbSessionPool(
+        getattr(config, 'VB_ENDPOINT', None),
+        getattr(config, 'VB_USER', None),
+        getattr(config, 'VB_PASSWORD', None),
+        SESSION_POOL_SIZE,
+        SESSION_MAX_AGE
+    )
+
     def __init__(self, vocab_id, request, language=None):
         super().__init__(vocab_id, request, language)
 
     @staticmethod
     def init():
-        VOCBENCH.voc = Vocbench(config.VB_USER, config.VB_PASSWORD, config.VB_ENDPOINT)
-
         # Get register item metadata
         for k in g.VOCABS:
             if g.VOCABS[k]['source'] == config.VocabSource.VOCBENCH:
                 if not os.path.isfile(os.path.join(APP_DIR, 'vocab_files', k + '.p')):
-                    g = Graph().parse(data=VOCBENCH.voc.export_project(k), format='turtle')
-
-                    VOCBENCH.pickle_to_file(k, g)
+                    # the export goes straight to disk and is parsed from there, it is never held in memory whole
+                    nt_path = VOCBENCH.harvest(k, os.path.join(APP_DIR, 'vocab_files'))
+                    parse_to_pickle(nt_path, 'nt', os.path.join(APP_DIR, 'vocab_files', k + '.p'))
                 else:
                     print('File {}.p exists, skipping pickling step.'.format(k))
                 g.VOCABS[k]['source'] = config.VocabSource.FILE
@@ -122,23 +237,104 @@ class VOCBENCH(Source):
                 #     g.VOCABS[k]['version'] = None
 
     @staticmethod
-    def _authed_request_object():
-        s = requests.session()
-        r = s.post(
-            config.VB_ENDPOINT + '/Auth/login',
-            data={
-                'email': config.VB_USER,
-                'password': config.VB_PASSWORD
-            }
-        )
-        if r.status_code == 200:
-            return s
-        else:
-            raise VbAuthException('Not able to log in. Error from VB is: ' + r.content.decode('utf-8'))
+    def harvest(project, directory):
+        """Streams a project's export, as N-Triples, to <directory>/<project>.nt.
+
+        The export is written as it arrives, HARVEST_CHUNK_SIZE bytes at a time, to a .part file and the bytes safely
+        written are recorded in a .harvest.json checkpoint, with the export's ETag and Last-Modified date. An interrupted
+        harvest resumes from its checkpoint with a Range request, made conditional on one of those by If-Range, or starts
+        again if it has neither or VocBench sends the whole export or a part starting anywhere else.
+
+        :param project: the VocBench project
+        :param directory: where to write the export
+
+        :return: the path of the export
+        :rtype: :class:`string`
+        """
+        nt_path = os.path.join(directory, project + '.nt')
+        part_path = nt_path + '.part'
+        checkpoint_path = nt_path + '.harvest.json'
+        try:
+            with open(checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            checkpoint = {}
+        # only resume an export known to be unchanged: If-Range needs a strong ETag or a Last-Modified date for that
+        validator = VOCBENCH.validator(checkpoint)
+        done = checkpoint.get('bytes', 0) if validator and os.path.isfile(part_path) else 0
+
+        while True:
+            headers = {}
+            if done:
+                headers['Range'] = 'bytes={}-'.format(done)
+                headers['If-Range'] = validator
+            with VOCBENCH.sessions.stream(
+                'GET',
+                config.VB_ENDPOINT + '/Export/export',
+                params={
+                    'ctx_project': project,
+                    'outputFormat': 'N-Triples',
+                    'filteringPipeline': '[]'
+                },
+                headers=headers,
+                timeout=HARVEST_TIMEOUT
+            ) as r:
+                if r.status_code == 200:
+                    done = 0
+                elif r.status_code != 206:
+                    raise VbException('There was an error: ' + r.content.decode('utf-8'))
+                elif VOCBENCH.range_start(r) != done:
+                    # not the part that was asked for, appending it would corrupt the export
+                    if not done:
+                        raise VbException('VocBench sent part of {} when asked for all of it'.format(project))
+                    done = 0
+                    continue
+
+                with open(part_path, 'r+b' if done else 'wb') as f:
+                    f.seek(done)
+                    f.truncate()  # anything after the checkpoint may be incomplete
+                    for chunk in r.iter_content(HARVEST_CHUNK_SIZE):
+                        f.write(chunk)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        done += len(chunk)
+                        with open(checkpoint_path, 'w') as c:
+                            json.dump({
+                                'bytes': done,
+                                'etag': r.headers.get('ETag'),
+                                'last_modified': r.headers.get('Last-Modified')
+                            }, c)
+            break
+
+        os.replace(part_path, nt_path)
+        os.remove(checkpoint_path)
+        return nt_path
+
+    @staticmethod
+    def validator(checkpoint):
+        """
+        Gets the If-Range validator of a harvest checkpoint: its ETag, unless that's weak, else its Last-Modified date
+        :return: the validator or None if the checkpoint has neither
+        :rtype: str
+        """
+        etag = checkpoint.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return checkpoint.get('last_modified')
+
+    @staticmethod
+    def range_start(r):
+        """
+        Gets the first byte of a partial (206) response, from its Content-Range header
+        :return: the byte's offset or None if there's no valid header
+        :rtype: int
+        """
+        m = re.match(r'bytes\s+(\d+)-\d+/(\d+|\*)$', r.headers.get('Content-Range', '').strip())
+        return int(m.group(1)) if m else None
 
     @classmethod
     def list_vocabularies(self):
-        s = VOCBENCH('x')._authed_request_object()
+        s = VOCBENCH.sessions
         r = s.get(config.VB_ENDPOINT + '/Projects/listProjects', params={'consumer': 'SYSTEM'})
         if r.status_code == 200:
             d = json.loads(r.content.decode('utf-8'))
@@ -155,7 +351,7 @@ class VOCBENCH(Source):
             raise VbException('There was an error: ' + r.content.decode('utf-8'))
 
     def list_collections(self):
-        s = VOCBENCH('x')._authed_request_object()
+        s = VOCBENCH.sessions
         r = s.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
@@ -175,8 +371,16 @@ class VOCBENCH(Source):
         else:
             raise VbException('There was an error: ' + r.content.decode('utf-8'))
 
-    def list_concepts(self):
-        s = VOCBENCH('x', self.request)._authed_request_object()
+    CONCEPTS_PATTERN = '''
+                        ?c  a skos:Concept ;
+                            skos:prefLabel ?pl .
+                            ?c dct:created ?created .
+                        OPTIONAL {{
+                            ?c dct:modified ?modified .
+                        }}'''
+
+    def list_concepts(self, page=None, per_page=None, sort='title', search=None):
+        s = VOCBENCH.sessions
         r = s.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
@@ -184,14 +388,10 @@ class VOCBENCH(Source):
                     '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
                     PREFIX dct: <http://purl.org/dc/terms/>
                     SELECT *
-                    WHERE {
-                        ?c  a skos:Concept ;
-                            skos:prefLabel ?pl .
-                            ?c dct:created ?created .
-                        OPTIONAL {{
-                            ?c dct:modified ?modified .
-                        }}
-                    }''',
+                    WHERE {''' + VOCBENCH.CONCEPTS_PATTERN + Source.search_filter('?pl', search) + '''
+                    }}
+                    ORDER BY {} ?c
+                    {}'''.format(self.CONCEPT_SORTS.get(sort, '?pl'), Source.limit_clause(page, per_page)),
                 'ctx_project': self.vocab_id
             }
         )
@@ -216,8 +416,29 @@ class VOCBENCH(Source):
         else:
             raise VbException('There was an error: ' + r.content.decode('utf-8'))
 
+    def count_concepts(self, search=None):
+        s = VOCBENCH.sessions
+        r = s.post(
+            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
+            data={
+                'query':
+                    '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+                    PREFIX dct: <http://purl.org/dc/terms/>
+                    SELECT (COUNT(*) AS ?count)
+                    WHERE {''' + VOCBENCH.CONCEPTS_PATTERN + Source.search_filter('?pl', search) + '''
+                    }''',
+                'ctx_project': self.vocab_id
+            }
+        )
+
+        if r.status_code == 200:
+            count = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
+            return int(count[0]['count']['value']) if count else 0
+        else:
+            raise VbException('There was an error: ' + r.content.decode('utf-8'))
+
     def get_vocabulary(self):
-        s = VOCBENCH('x', self.request)._authed_request_object()
+        s = VOCBENCH.sessions
         r = s.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
@@ -267,191 +488,36 @@ class VOCBENCH(Source):
         else:
             raise VbException('There was an error: ' + r.content.decode('utf-8'))
 
-    def get_collection(self, uri):
-        return NotImplementedError
+    def _describe(self, uri):
+        """Gets the object's classes and its Concept or Collection properties from the VocBench project in one query,
+        see Source._describe()
 
-    def get_concept(self, uri):
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX dct: <http://purl.org/dc/terms/>
-            SELECT *
-            WHERE {{
-              <{0}> skos:prefLabel ?pl .
-              OPTIONAL {{ <{0}> skos:definition ?d }}
-              OPTIONAL {{ <{0}> dct:created ?created }}
-              OPTIONAL {{ <{0}> dct:modified ?modified }}
-            }}'''.format(uri)
-        self.s = VOCBENCH('x', self.request)._authed_request_object()
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        metadata = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings'][0]
-
-        # get the concept's altLabels
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{
-              <{}> skos:altLabel ?al .
-            }}'''.format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        altLabels = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        # get the concept's hiddenLabels
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{
-              <{}> skos:hiddenLabel ?hl .
-            }}'''.format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        hiddenLabels = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        # get the concept's broaders
-        q = ''' PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{
-              <{}> skos:broader ?b .
-              ?b skos:prefLabel ?pl .
-            }}'''.format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        broaders = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
+        :param uri: the URI of the object
 
-        # get the concept's narrowers
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{
-              <{}> skos:narrower ?n .
-              ?n skos:prefLabel ?pl .
-            }}'''.format(uri)
-        r = self.s.post(
+        :return: SPARQL result rows with ?p, ?o and, for related objects, ?label
+        :rtype: :class:`list`
+        """
+        r = VOCBENCH.sessions.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
-                'query': q,
+                'query': Source.DESCRIBE_QUERY.format(pattern=self.describe_pattern(uri)),
                 'ctx_project': self.vocab_id
             }
         )
-        narrowers = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
+        try:
+            return json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
+        except:
+            raise VbException(r.content.decode('utf-8'))
 
-        # get exactMatch
-        q = """PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{
-                <{}> skos:exactMatch ?s .
-            }}""".format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        exactMatches = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
+    def get_collection(self, uri):
+        return self._make_collection(uri, self._describe(uri))
 
-        # get closeMatch
-        q = """PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-                    SELECT *
-                    WHERE {{
-                        <{}> skos:closeMatch ?s .
-                    }}""".format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        closeMatches = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        # get broadMatch
-        q = """PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-                            SELECT *
-                            WHERE {{
-                                <{}> skos:broadMatch ?s .
-                            }}""".format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        broadMatches = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        # get narrowMatch
-        q = """PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-                                    SELECT *
-                                    WHERE {{
-                                        <{}> skos:narrowMatch ?s .
-                                    }}""".format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        narrowMatches = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        # get relatedMatch
-        q = """PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-                                            SELECT *
-                                            WHERE {{
-                                                <{}> skos:relatedMatch ?s .
-                                            }}""".format(uri)
-        r = self.s.post(
-            config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
-            data={
-                'query': q,
-                'ctx_project': self.vocab_id
-            }
-        )
-        relatedMatches = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-
-        from model.concept import Concept
-        return Concept(
-            self.vocab_id,
-            uri,
-            metadata['pl']['value'],
-            metadata.get('d').get('value') if metadata.get('d') is not None else None,
-            [x.get('al').get('value') for x in altLabels],
-            [x.get('hl').get('value') for x in hiddenLabels],
-            metadata.get('sc').get('value') if metadata.get('sc') is not None else None,
-            metadata.get('cn').get('value') if metadata.get('cn') is not None else None,
-            [{'uri': x.get('b').get('value'), 'prefLabel': x.get('pl').get('value')} for x in broaders],
-            [{'uri': x.get('n').get('value'), 'prefLabel': x.get('pl').get('value')} for x in narrowers],
-            [x['s']['value'] for x in exactMatches],
-            [x['s']['value'] for x in closeMatches],
-            [x['s']['value'] for x in broadMatches],
-            [x['s']['value'] for x in narrowMatches],
-            [x['s']['value'] for x in relatedMatches],
-            None, # TODO: replace Sem Properties sub,
-            metadata.get('created').get('value')[:10] if metadata.get('created') else None,
-            metadata.get('modified').get('value')[:10] if metadata.get('modified') else None,
-        )
+    def get_concept(self, uri):
+        return self._make_concept(uri, self._describe(uri))
 
     def get_concept_hierarchy(self, concept_scheme_uri):
         # returns an ordered list of tuples, (hierarchy level, Concept URI, Concept prefLabel)
-        s = VOCBENCH('x', self.request)._authed_request_object()
+        s = VOCBENCH.sessions
         r = s.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
@@ -481,54 +547,7 @@ class VOCBENCH(Source):
 </stresponse>
 """
             cs = json.loads(r.content.decode('utf-8'))['result']['sparql']['results']['bindings']
-            hierarchy = []
-            previous_parent_uri = None
-            last_index = 0
-
-            for c in cs:
-                # insert all topConceptOf directly
-                test = c
-                if 'parent' not in c:
-                    continue
-                if str(c['parent']['value']) == concept_scheme_uri:
-                    hierarchy.append((
-                        int(c['length']['value']),
-                        c['c']['value'],
-                        c['pl']['value'],
-                        None
-                    ))
-                else:
-                    # If this is not a topConcept, see if it has the same URI as the previous inserted Concept
-                    # If so, use that Concept's index + 1
-                    this_parent = c['parent']['value']
-                    if this_parent == previous_parent_uri:
-                        # use last inserted index
-                        hierarchy.insert(last_index + 1, (
-                            int(c['length']['value']),
-                            c['c']['value'],
-                            c['pl']['value'],
-                            c['parent']['value']
-                        ))
-                        last_index += 1
-                    # This is not a TopConcept and it has a differnt parent from the previous insert
-                    # So insert it after it's parent
-                    else:
-                        i = 0
-                        parent_index = 0
-                        for t in hierarchy:
-                            if this_parent in t[1]:
-                                parent_index = i
-                            i += 1
-
-                        hierarchy.insert(parent_index + 1, (
-                            int(c['length']['value']),
-                            c['c']['value'],
-                            c['pl']['value'],
-                            c['parent']['value']
-                        ))
-
-                        last_index = parent_index + 1
-                    previous_parent_uri = this_parent
+            hierarchy = Source.order_concept_hierarchy([c for c in cs if 'parent' in c], concept_scheme_uri)
             return Source.draw_concept_hierarchy(hierarchy, self.request, self.vocab_id)
         else:
             raise VbException('There was an error: ' + r.content.decode('utf-8'))
@@ -549,7 +568,7 @@ class VOCBENCH(Source):
                 <{}> a ?c .
             }}
         '''.format(uri)
-        s = VOCBENCH('x', self.request)._authed_request_object()
+        s = VOCBENCH.sessions
         r = s.post(
             config.VB_ENDPOINT + '/SPARQL/evaluateQuery',
             data={
@@ -1,5 +1,6 @@
 from .FILE import *
 from .GITHUB import *
+from .OXIGRAPH import *
 from .RVA import *
 from .SPARQL import *
 from .VOCBENCH import *
@@ -0,0 +1,113 @@
+import _config as config
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# seconds a SPARQL result is reused for, 0 turns the cache off
+if hasattr(config, 'SPARQL_CACHE_TTL'):
+    CACHE_TTL = config.SPARQL_CACHE_TTL
+else:
+    CACHE_TTL = 3600
+
+if hasattr(config, 'SPARQL_CACHE_MAX_ENTRIES'):
+    CACHE_MAX_ENTRIES = config.SPARQL_CACHE_MAX_ENTRIES
+else:
+    CACHE_MAX_ENTRIES = 1000
+
+# approximate, measured as the size of each result's JSON
+if hasattr(config, 'SPARQL_CACHE_MAX_BYTES'):
+    CACHE_MAX_BYTES = config.SPARQL_CACHE_MAX_BYTES
+else:
+    CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class QueryCache:
+    """
+    A bounded, thread-safe cache of SPARQL query results
+
+    Results expire ttl seconds after they were fetched. When there are more than max_entries results, or they add up to
+    more than max_bytes, the least recently used ones are evicted.
+    """
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expiry time, size, result), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint, q, username=None, password=None):
+        """
+        Makes the cache key for a query. The query text is kept as it is, apart from leading and trailing whitespace,
+        as whitespace within its literals is significant, and credentials are only kept as a hash
+        """
+        credentials = None
+        if username or password:
+            credentials = hashlib.sha256('{}:{}'.format(username, password).encode('utf-8')).hexdigest()
+        return endpoint, q.strip(), credentials
+
+    def get(self, key):
+        """
+        Gets a cached result
+        :return: the result or None if it isn't cached or has expired
+        """
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, result):
+        """
+        Caches a result, evicting the least recently used results if needed to stay within bounds
+        """
+        if self.ttl <= 0 or result is None:
+            return
+        size = len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, result)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: the cache's counters and current size
+        :rtype: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes
+        }
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+
+QUERY_CACHE = QueryCache(CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
@@ -0,0 +1,237 @@
+import mmap
+import os
+import struct
+from array import array
+from functools import lru_cache
+from rdflib import URIRef, BNode, Literal
+
+# file layout: header, term offsets (uint64), term bytes, then the SPO, POS & OSP triple arrays (uint32), all in the
+# byte order of the machine that wrote the file
+MAGIC = b'SKOSCG02'
+HEADER = struct.Struct('=8sQQ')
+
+# the byte lengths of a literal's language and datatype, which come before them and its value
+LITERAL_LENGTHS = struct.Struct('>II')
+
+
+def encode_term(term):
+    """
+    Encodes an rdflib term as bytes that decode_term() can turn back into an equal term. A literal's fields are
+    length-prefixed, not separated, as its value can contain any character
+    """
+    if isinstance(term, Literal):
+        language = (term.language or '').encode('utf-8')
+        datatype = (str(term.datatype) if term.datatype else '').encode('utf-8')
+        return b'L' + LITERAL_LENGTHS.pack(len(language), len(datatype)) + language + datatype + \
+            str(term).encode('utf-8')
+    elif isinstance(term, BNode):
+        return b'B' + str(term).encode('utf-8')
+    return b'U' + str(term).encode('utf-8')
+
+
+def decode_term(data):
+    kind, data = data[:1], data[1:]
+    if kind == b'L':
+        language_length, datatype_length = LITERAL_LENGTHS.unpack_from(data)
+        start = LITERAL_LENGTHS.size
+        language = data[start:start + language_length]
+        datatype = data[start + language_length:start + language_length + datatype_length]
+        value = data[start + language_length + datatype_length:]
+        return Literal(
+            value.decode('utf-8'),
+            lang=language.decode('utf-8') or None,
+            datatype=URIRef(datatype.decode('utf-8')) if datatype else None
+        )
+    elif kind == b'B':
+        return BNode(data.decode('utf-8'))
+    return URIRef(data.decode('utf-8'))
+
+
+class CompactGraph:
+    """
+    A read-only, dictionary-encoded triple store for a FILE vocab, memory-mapped from a file made by write()
+
+    Each term is stored once, as bytes, in sorted order so that its position is its integer ID and terms can be found by
+    binary search. The triples are three arrays of ID triples, sorted as SPO, POS and OSP, so any triple pattern is a
+    binary search for a contiguous range. Nothing is read into memory when opening, pages are read by the OS as they
+    are used and can be shared by every process serving the vocab.
+
+    Supports the subset of the rdflib Graph API that the FILE source uses: triples(), subjects(), objects(), value()
+    and the in operator.
+    """
+    # the order of (s, p, o) within each index's triples
+    ORDERS = {
+        'spo': (0, 1, 2),
+        'pos': (1, 2, 0),
+        'osp': (2, 0, 1),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, n_terms, n_triples = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a compact triple store'.format(path))
+        self.n_terms = n_terms
+        self.n_triples = n_triples
+
+        start = HEADER.size
+        self._offsets = view[start:start + (n_terms + 1) * 8].cast('Q')
+        start += (n_terms + 1) * 8
+        self._terms = view[start:start + self._offsets[n_terms]]
+        start = CompactGraph._aligned(start + self._offsets[n_terms])
+        self._indexes = {}
+        for name in ('spo', 'pos', 'osp'):
+            self._indexes[name] = view[start:start + n_triples * 12].cast('I')
+            start += n_triples * 12
+        self.term = lru_cache(maxsize=65536)(self._term)
+
+    @staticmethod
+    def is_current(path):
+        """
+        Checks that a file is a compact triple store in this version's format
+        :rtype: bool
+        """
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    @staticmethod
+    def _aligned(position):
+        return (position + 3) & ~3
+
+    @staticmethod
+    def write(graph, path):
+        """
+        Writes a graph as a compact triple store file, via a temporary file so readers never see a partial store
+        :param graph: an rdflib Graph
+        :param path: the file to write
+        :return: nothing
+        """
+        terms = set()
+        for triple in graph.triples((None, None, None)):
+            terms.update(triple)
+        encoded = sorted(encode_term(t) for t in terms)
+        ids = {e: i for i, e in enumerate(encoded)}
+
+        offsets = array('Q', [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        id_triples = [tuple(ids[encode_term(t)] for t in triple) for triple in graph.triples((None, None, None))]
+
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(encoded), len(id_triples)))
+            f.write(offsets.tobytes())
+            f.write(b''.join(encoded))
+            f.write(b'\x00' * (CompactGraph._aligned(f.tell()) - f.tell()))
+            for order in CompactGraph.ORDERS.values():
+                index = array('I')
+                for triple in sorted(tuple(t[i] for i in order) for t in id_triples):
+                    index.extend(triple)
+                f.write(index.tobytes())
+        os.replace(tmp_path, path)
+
+    def _term(self, term_id):
+        return decode_term(bytes(self._terms[self._offsets[term_id]:self._offsets[term_id + 1]]))
+
+    def term_id(self, term):
+        """
+        Finds a term's ID by binary search of the sorted terms
+        :return: the ID or None if the term isn't in the store
+        :rtype: int
+        """
+        encoded = encode_term(term)
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = bytes(self._terms[self._offsets[mid]:self._offsets[mid + 1]])
+            if found < encoded:
+                lo = mid + 1
+            elif found > encoded:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _range(self, index, key):
+        # the range of an index's triples that start with the key's IDs
+        n = len(key)
+
+        def bound(upper):
+            lo, hi = 0, self.n_triples
+            while lo < hi:
+                mid = (lo + hi) // 2
+                found = tuple(index[mid * 3:mid * 3 + n])
+                if found < key or (upper and found == key):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        return bound(False), bound(True)
+
+    def _id_triples(self, s, p, o):
+        # pick the index that has the bound terms first
+        if s is not None:
+            name, key = ('spo', (s, p, o) if o is not None else (s, p)) if p is not None else \
+                (('osp', (o, s)) if o is not None else ('spo', (s,)))
+        elif p is not None:
+            name, key = 'pos', (p, o) if o is not None else (p,)
+        elif o is not None:
+            name, key = 'osp', (o,)
+        else:
+            name, key = 'spo', ()
+        index = self._indexes[name]
+        order = CompactGraph.ORDERS[name]
+        lo, hi = self._range(index, key) if key else (0, self.n_triples)
+        for i in range(lo, hi):
+            stored = index[i * 3:i * 3 + 3]
+            triple = [0, 0, 0]
+            for position, term_id in zip(order, stored):
+                triple[position] = term_id
+            yield tuple(triple)
+
+    def triples(self, pattern):
+        """
+        Matches a triple pattern, like rdflib's Graph.triples()
+        :param pattern: tuple(s, p, o), each an rdflib term or None for any
+        :return: the matching triples
+        :rtype: generator
+        """
+        ids = []
+        for term in pattern:
+            if term is None:
+                ids.append(None)
+            else:
+                term_id = self.term_id(term)
+                if term_id is None:
+                    return
+                ids.append(term_id)
+        for triple in self._id_triples(*ids):
+            yield tuple(self.term(i) for i in triple)
+
+    def subjects(self, predicate=None, object=None):
+        for s, p, o in self.triples((None, predicate, object)):
+            yield s
+
+    def objects(self, subject=None, predicate=None):
+        for s, p, o in self.triples((subject, predicate, None)):
+            yield o
+
+    def value(self, subject=None, predicate=None, object=None):
+        for s, p, o in self.triples((subject, predicate, object)):
+            return o if object is None else s
+        return None
+
+    def __contains__(self, triple):
+        for _ in self.triples(triple):
+            return True
+        return False
+
+    def __len__(self):
+        return self.n_triples
@@ -0,0 +1,145 @@
+import _config as config
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from helper import APP_DIR
+
+# where fetched documents are kept, with their ETag & Last-Modified validators
+if hasattr(config, 'DOCUMENT_CACHE_DIR'):
+    CACHE_DIR = config.DOCUMENT_CACHE_DIR
+else:
+    CACHE_DIR = os.path.join(APP_DIR, 'cache', 'documents')
+
+# seconds a cached document is used without asking the server whether it has changed
+if hasattr(config, 'DOCUMENT_CACHE_MAX_AGE'):
+    CACHE_MAX_AGE = config.DOCUMENT_CACHE_MAX_AGE
+else:
+    CACHE_MAX_AGE = 3600
+
+# attempts at fetching a document, waiting BACKOFF seconds after the first failure and doubling each time after
+if hasattr(config, 'DOCUMENT_FETCH_ATTEMPTS'):
+    FETCH_ATTEMPTS = config.DOCUMENT_FETCH_ATTEMPTS
+else:
+    FETCH_ATTEMPTS = 5
+
+if hasattr(config, 'DOCUMENT_FETCH_BACKOFF'):
+    FETCH_BACKOFF = config.DOCUMENT_FETCH_BACKOFF
+else:
+    FETCH_BACKOFF = 0.5
+
+if hasattr(config, 'DOCUMENT_FETCH_TIMEOUT'):
+    FETCH_TIMEOUT = config.DOCUMENT_FETCH_TIMEOUT
+else:
+    FETCH_TIMEOUT = (5, 60)
+
+
+class DocumentCache:
+    """
+    Fetches documents over HTTP through a shared pool of kept-alive connections, keeping them on disk
+
+    A cached document younger than max_age is used as it is. An older one is revalidated with a conditional request
+    (If-None-Match / If-Modified-Since) so an unchanged document is not downloaded again. Failed fetches are retried
+    with exponential backoff.
+    """
+    def __init__(self, cache_dir, max_age, pool_size=10):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _paths(self, url, headers):
+        key = hashlib.sha256(json.dumps([url, sorted((headers or {}).items())]).encode('utf-8')).hexdigest()
+        path = os.path.join(self.cache_dir, key)
+        return path + '.body', path + '.json'
+
+    def cached(self, url, headers=None):
+        """
+        Gets a cached document and what's known about it
+        :return: tuple(body bytes, metadata dict) or (None, None) if it isn't cached
+        :rtype: tuple
+        """
+        body_path, meta_path = self._paths(url, headers)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                return f.read(), meta
+        except (OSError, ValueError):
+            return None, None
+
+    def store(self, url, headers, body, meta):
+        body_path, meta_path = self._paths(url, headers)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path, data, mode in ((body_path, body, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def get(self, url, headers=None, max_age=None):
+        """
+        Gets a document, from the cache if it's fresh or unchanged, otherwise from its server
+        :param url: the document's URL
+        :param headers: request headers, e.g. Accept. Documents are cached separately for different headers
+        :param max_age: overrides the cache's max_age, 0 always revalidates
+        :return: the document
+        :rtype: bytes
+        """
+        body, meta = self.cached(url, headers)
+        max_age = self.max_age if max_age is None else max_age
+        if body is not None and time.time() - meta['fetched'] < max_age:
+            return body
+
+        conditional = dict(headers or {})
+        if body is not None:
+            if meta.get('etag'):
+                conditional['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                conditional['If-Modified-Since'] = meta['last_modified']
+
+        r = self.request(url, conditional)
+        if r.status_code == 304 and body is not None:
+            meta['fetched'] = time.time()
+        else:
+            body = r.content
+            meta = {
+                'url': url,
+                'fetched': time.time(),
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified')
+            }
+        self.store(url, headers, body, meta)
+        return body
+
+    def request(self, url, headers):
+        """
+        GETs a URL, retrying failures and server errors with exponential backoff
+        :return: the response, whose status is 200 or 304
+        :rtype: requests.Response
+        """
+        for attempt in range(FETCH_ATTEMPTS):
+            try:
+                r = self.session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+                if r.status_code in (200, 304):
+                    return r
+                if r.status_code < 500 and r.status_code != 429:
+                    r.raise_for_status()  # not worth trying again
+                error = requests.HTTPError('{} {}'.format(r.status_code, r.reason), response=r)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            logging.warning('Failed to fetch {}. Attempt: {}. {}'.format(url, attempt + 1, error))
+            if attempt + 1 < FETCH_ATTEMPTS:
+                # full jitter so concurrent retries don't all land together
+                time.sleep(random.uniform(0, FETCH_BACKOFF * 2 ** attempt))
+        raise Exception('Failed to fetch {}. Maximum attempts exceeded {}.'.format(url, FETCH_ATTEMPTS))
+
+
+DOCUMENT_CACHE = DocumentCache(CACHE_DIR, CACHE_MAX_AGE)
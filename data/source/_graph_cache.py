@@ -0,0 +1,115 @@
+import _config as config
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# approximate, measured as the size of each graph's pickle file
+if hasattr(config, 'FILE_GRAPH_CACHE_MAX_BYTES'):
+    GRAPH_CACHE_MAX_BYTES = config.FILE_GRAPH_CACHE_MAX_BYTES
+else:
+    GRAPH_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class GraphCache:
+    """
+    A process-wide, thread-safe cache of the unpickled rdflib Graphs of FILE vocabs, keyed by vocab ID
+
+    A cached graph is reused until its pickle file changes. A file whose mtime or size has changed is hashed and only
+    reloaded if its content has too. When the graphs' files add up to more than max_bytes, the least recently used
+    graphs are evicted, though the graph just asked for is always kept.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # vocab ID -> (mtime, size, sha256, graph), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # vocab ID -> lock held while its graph is being loaded
+
+    @staticmethod
+    def digest(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def unpickle(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def get(self, vocab_id, path, load=None):
+        """
+        Gets a vocab's graph, loading it from path if it isn't cached or its file has changed
+        :param vocab_id: the vocab's ID
+        :param path: the vocab's graph file
+        :param load: a function to load the graph from path, by default the file is unpickled
+        :return: the graph
+        :rtype: rdflib.Graph
+        """
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(vocab_id)
+            if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+                self._entries.move_to_end(vocab_id)
+                self.hits += 1
+                return entry[3]
+            loading = self._loading.setdefault(vocab_id, threading.Lock())
+
+        # one thread loads each graph while others asking for it wait
+        with loading:
+            with self._lock:
+                entry = self._entries.get(vocab_id)
+                if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+                    self._entries.move_to_end(vocab_id)
+                    self.hits += 1
+                    return entry[3]
+
+            digest = GraphCache.digest(path)
+            if entry is not None and entry[2] == digest:
+                graph = entry[3]  # only touched, the content is the same
+            else:
+                graph = load(path) if load is not None else GraphCache.unpickle(path)
+                self.misses += 1
+            self.put(vocab_id, (stat.st_mtime, stat.st_size, digest, graph))
+            return graph
+
+    def put(self, vocab_id, entry):
+        with self._lock:
+            self._remove(vocab_id)
+            self._entries[vocab_id] = entry
+            self._bytes += entry[1]
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, vocab_id):
+        entry = self._entries.pop(vocab_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: the cache's counters and current size
+        :rtype: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'graphs': len(self._entries),
+            'bytes': self._bytes
+        }
+
+
+GRAPH_CACHE = GraphCache(GRAPH_CACHE_MAX_BYTES)
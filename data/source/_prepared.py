@@ -0,0 +1,64 @@
+import threading
+from rdflib.namespace import SKOS, DCTERMS, OWL, RDF, RDFS
+from rdflib.plugins.sparql import prepareQuery
+
+# the prefixes available to every registered query
+NAMESPACES = {
+    'skos': SKOS,
+    'dct': DCTERMS,
+    'owl': OWL,
+    'rdf': RDF,
+    'rdfs': RDFS,
+}
+
+
+class PreparedQueries:
+    """
+    A process-wide registry of SPARQL queries for rdflib to evaluate against in-memory graphs
+
+    Each query is parsed and translated to SPARQL algebra once, on first use, and then shared by all requests
+    (threads). Values are given to a query as initBindings, never formatted into its text.
+    """
+    def __init__(self):
+        self._texts = {}
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, q):
+        """
+        Adds a query to the registry
+        :param name: the name the query is run by
+        :param q: the SPARQL query, which can use the NAMESPACES prefixes without declaring them
+        :return: nothing
+        """
+        self._texts[name] = q
+
+    def prepared(self, name):
+        """
+        Gets a registered query, preparing it first if this process hasn't already done so
+        :param name: the query's name
+        :return: the prepared query
+        :rtype: rdflib.plugins.sparql.sparql.Query
+        """
+        query = self._prepared.get(name)
+        if query is None:
+            with self._lock:
+                query = self._prepared.get(name)
+                if query is None:
+                    query = prepareQuery(self._texts[name], initNs=NAMESPACES)
+                    self._prepared[name] = query
+        return query
+
+    def query(self, graph, name, **bindings):
+        """
+        Runs a registered query against a graph
+        :param graph: the rdflib Graph to query
+        :param name: the query's name
+        :param bindings: values for the query's variables, e.g. s=URIRef(uri) for ?s
+        :return: the query's result
+        :rtype: rdflib.query.Result
+        """
+        return graph.query(self.prepared(name), initBindings=bindings)
+
+
+PREPARED_QUERIES = PreparedQueries()
@@ -1,15 +1,20 @@
 import _config as config
+import copy
 import sys
-from rdflib import Graph, URIRef
-from rdflib.namespace import SKOS
-import markdown
-from flask import g
-from SPARQLWrapper import SPARQLWrapper, JSON, BASIC
-import dateutil
+from rdflib import Graph, URIRef, Literal
+from rdflib.namespace import SKOS, RDF, RDFS
+from flask import g, copy_current_request_context
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from data.source._transport import SparqlTransport
+from data.source._cache import QueryCache, QUERY_CACHE
+from data.source._documents import DOCUMENT_CACHE
+import dateutil.parser
 from model.concept import Concept
 from collections import OrderedDict
-from helper import make_title
+from helper import make_title, url_encode
+from html import escape
 import logging
+import time
 
 # Default to English if no DEFAULT_LANGUAGE in config
 if hasattr(config, 'DEFAULT_LANGUAGE:'):
@@ -17,15 +22,45 @@ if hasattr(config, 'DEFAULT_LANGUAGE:'):
 else:
     DEFAULT_LANGUAGE = 'en'
 
+# the maximum number of a page's queries run at once, across all requests
+if hasattr(config, 'QUERY_WORKERS'):
+    QUERY_WORKERS = config.QUERY_WORKERS
+else:
+    QUERY_WORKERS = 16
+
+# seconds a page waits for all of its queries before rendering whatever it has
+if hasattr(config, 'PAGE_DEADLINE'):
+    PAGE_DEADLINE = config.PAGE_DEADLINE
+else:
+    PAGE_DEADLINE = 30
+
+QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix='source-query')
+
+# the maximum number of Concept documents fetched at once when crawling narrower Concepts
+if hasattr(config, 'NARROWER_WORKERS'):
+    NARROWER_WORKERS = config.NARROWER_WORKERS
+else:
+    NARROWER_WORKERS = 8
+
+NARROWER_EXECUTOR = ThreadPoolExecutor(max_workers=NARROWER_WORKERS, thread_name_prefix='narrower-fetch')
+
 
 class Source:
     VOC_TYPES = [
         'http://purl.org/vocommons/voaf#Vocabulary',
         'http://www.w3.org/2004/02/skos/core#ConceptScheme',
         'http://www.w3.org/2004/02/skos/core#ConceptCollection',
+        'http://www.w3.org/2004/02/skos/core#Collection',
         'http://www.w3.org/2004/02/skos/core#Concept',
     ]
 
+    # the ways list_concepts() can be sorted, mapped to the query variables they sort by
+    CONCEPT_SORTS = {
+        'title': '?pl',
+        'created': '?created',
+        'modified': '?modified',
+    }
+
     def __init__(self, vocab_id, request, language=None):
         self.vocab_id = vocab_id
         self.request = request
@@ -36,8 +71,11 @@ class Source:
         """
         Specialised Sources must implement a collect method to get all the vocabs of their sort, listed in
         _config/__init__.py, at startup
+
+        :return: vocab IDs mapped to their Vocabulary objects, for the vocab index
+        :rtype: dict
         """
-        pass
+        return {}
 
     def list_collections(self):
         vocab = g.VOCABS[self.vocab_id]
@@ -54,24 +92,43 @@ class Source:
 
         return [(x.get('c').get('value'), x.get('l').get('value')) for x in collections]
 
-    def list_concepts(self):
+    def _concepts_where(self, search=None):
         vocab = g.VOCABS[self.vocab_id]
-        q = '''
-             PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-             PREFIX dct: <http://purl.org/dc/terms/>
-             SELECT *
-             WHERE {{GRAPH ?g {{
+        return '''{{GRAPH ?g {{
                  ?c skos:inScheme <{concept_scheme_uri}> . 
                  {{?c skos:prefLabel ?pl .
                     FILTER(lang(?pl) = "{language}" || lang(?pl) = "") }}
+                 {search_filter}
                  OPTIONAL {{ ?c skos:definition ?d .
                     FILTER(lang(?d) = "{language}" || lang(?d) = "") }}
                  OPTIONAL {{ ?c dct:created ?created . }}
                  OPTIONAL {{ ?c dct:modified ?modified . }}
-             }} }}
-             ORDER BY ?pl'''.format(concept_scheme_uri=vocab.concept_scheme_uri, 
-                                    language=self.language)
-        concepts = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
+             }} }}'''.format(concept_scheme_uri=vocab.concept_scheme_uri,
+                             language=self.language,
+                             search_filter=Source.search_filter('?pl', search))
+
+    def list_concepts(self, page=None, per_page=None, sort='title', search=None):
+        """
+        Lists the vocab's Concepts, or just one page of them
+
+        :param page: the page number, starting from 1, or None for all Concepts
+        :param per_page: the number of Concepts per page
+        :param sort: one of Source.CONCEPT_SORTS
+        :param search: only list Concepts whose prefLabel contains this text, ignoring case
+        :return: list of Concept metadata dicts
+        :rtype: list
+        """
+        vocab = g.VOCABS[self.vocab_id]
+        q = '''
+             PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+             PREFIX dct: <http://purl.org/dc/terms/>
+             SELECT *
+             WHERE {where}
+             ORDER BY {order} ?c
+             {limit}'''.format(where=self._concepts_where(search),
+                               order=self.CONCEPT_SORTS.get(sort, '?pl'),
+                               limit=Source.limit_clause(page, per_page))
+        concepts = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password) or []
 
         concept_items = []
         for concept in concepts:
@@ -88,118 +145,241 @@ class Source:
 
         return concept_items
 
+    def count_concepts(self, search=None):
+        """
+        Counts the items list_concepts() would return, without fetching them
+
+        :param search: only count Concepts whose prefLabel contains this text, ignoring case
+        :return: the number of Concepts
+        :rtype: int
+        """
+        vocab = g.VOCABS[self.vocab_id]
+        q = '''
+             PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+             PREFIX dct: <http://purl.org/dc/terms/>
+             SELECT (COUNT(*) AS ?count)
+             WHERE {where}'''.format(where=self._concepts_where(search))
+        result = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
+
+        return int(result[0]['count']['value']) if result else 0
+
+    # the Concept label properties indexed by list_labels()
+    LABEL_PROPERTIES = (SKOS.prefLabel, SKOS.altLabel, SKOS.hiddenLabel)
+
+    @staticmethod
+    def list_labels(vocab):
+        """
+        Lists every label of every Concept in a vocab, in all languages, for the label index. Needs no request
+
+        :param vocab: the vocab's Vocabulary object, from the vocab index
+        :return: list of tuple(Concept URI, label property URI, label)
+        :rtype: list
+        """
+        q = '''
+            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+            SELECT ?c ?p ?l
+            WHERE {{GRAPH ?g {{
+                ?c skos:inScheme <{concept_scheme_uri}> .
+                VALUES ?p {{ {properties} }}
+                ?c ?p ?l .
+            }} }}'''.format(concept_scheme_uri=vocab.concept_scheme_uri,
+                             properties=' '.join(p.n3() for p in Source.LABEL_PROPERTIES))
+        # not through the query cache, these results are large and only wanted once per index
+        try:
+            labels = SparqlTransport.for_endpoint(vocab.sparql_endpoint).query(
+                q, vocab.sparql_username, vocab.sparql_password)['results']['bindings']
+        except Exception as e:
+            logging.debug('Unable to list the labels of vocab {}: {}'.format(vocab.id, e))
+            return []
+
+        return [(x['c']['value'], x['p']['value'], x['l']['value']) for x in labels]
+
+    @staticmethod
+    def search_filter(variable, search):
+        """
+        Makes a SPARQL FILTER for a case-insensitive search within a variable's text
+
+        :param variable: the query variable, e.g. '?pl'
+        :param search: the text to search for, or None for no filter
+        :return: the FILTER, empty for no search
+        :rtype: str
+        """
+        if not search:
+            return ''
+        return 'FILTER(CONTAINS(LCASE(STR({})), LCASE({})))'.format(variable, Literal(search).n3())
+
+    @staticmethod
+    def limit_clause(page, per_page):
+        """
+        Makes the SPARQL LIMIT & OFFSET for a page of results
+
+        :param page: the page number, starting from 1, or None for all results
+        :param per_page: the number of results per page
+        :return: the LIMIT & OFFSET clause, empty for all results
+        :rtype: str
+        """
+        if page is None or per_page is None:
+            return ''
+        return 'LIMIT {} OFFSET {}'.format(int(per_page), (max(int(page), 1) - 1) * int(per_page))
+
     def get_vocabulary(self):
         """
         Get a vocab from the cache
         :return:
         :rtype:
         """
-        vocab = g.VOCABS[self.vocab_id]
+        # a copy, the indexed vocab is shared by every request and must not take on this request's language or host
+        vocab = copy.copy(g.VOCABS[self.vocab_id])
 
-        vocab.hasTopConcept = self.get_top_concepts()
-        vocab.concept_hierarchy = self.get_concept_hierarchy()
+        # independent queries so run them together and wait only for the slowest
+        vocab.hasTopConcept, vocab.concept_hierarchy = Source.run_concurrently(
+            (self.get_top_concepts, None),
+            (self.get_concept_hierarchy, '')
+        )
         return vocab
 
+    @staticmethod
+    def run_concurrently(*calls, deadline=None):
+        """
+        Runs functions on the shared query executor, within this request's context, and waits for them all
+
+        A function that misses the deadline can't be stopped, but its SPARQL queries wait for a response no longer than
+        the deadline, so it soon gives its worker back.
+
+        :param calls: tuples of (function, default), where default is used if the function misses the deadline
+        :param deadline: seconds to wait for all of the functions, defaults to PAGE_DEADLINE
+        :return: the functions' results, in order
+        :rtype: list
+        """
+        vocabs = g.VOCABS
+
+        deadline = PAGE_DEADLINE if deadline is None else deadline
+        started = time.time()
+
+        def in_context(f):
+            @copy_current_request_context
+            def run():
+                g.VOCABS = vocabs  # the copied request gets its own g
+                with SparqlTransport.deadline(started + deadline):
+                    return f()
+            return run
+
+        futures = [(QUERY_EXECUTOR.submit(in_context(f)), default) for f, default in calls]
+        results = []
+        for future, default in futures:
+            try:
+                results.append(future.result(timeout=max(started + deadline - time.time(), 0)))
+            except TimeoutError:
+                logging.error('A query missed the {}s page deadline'.format(deadline))
+                future.cancel()  # only stops it if it hasn't started
+                results.append(default)
+        return results
+
     def get_collection(self, uri):
+        return self._make_collection(uri, self._describe(uri))
+
+    def get_concept(self):
+        uri = self.request.values.get('uri')
+        return self._make_concept(uri, self._describe(uri))
+
+    def _describe(self, uri):
+        """
+        Gets what's needed to present an object - its classes and its Concept or Collection properties - in a single
+        query with one row per (property, value) so that the result grows linearly with the number of property values
+        rather than with their Cartesian product. Related concepts and members get their prefLabels alongside
+
+        :param uri: the object's URI
+        :return: SPARQL result rows with ?p, ?o and, for related objects, ?label
+        :rtype: list
+        """
         vocab = g.VOCABS[self.vocab_id]
-        q = '''PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT *
-            WHERE {{ GRAPH ?g {{
-              {{ <{collection_uri}> (rdfs:label | skos:prefLabel) ?l .
-                  FILTER(lang(?l) = "{language}" || lang(?l) = "") }}
-              OPTIONAL {{?s rdfs:comment ?c .
-                  FILTER(lang(?c) = "{language}" || lang(?c) = "") }}
-            }} }}'''.format(collection_uri=uri, 
-                            language=self.language)
-        metadata = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
-
-        # get the collection's members
-        q = '''PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            SELECT *
-            WHERE {{ GRAPH ?g {{
-              <{}> skos:member ?m .
-              {{ ?n skos:prefLabel ?pl .
-                  FILTER(lang(?pl) = "{language}" || lang(?pl) = "") }}
-            }} }}'''.format(collection_uri=uri, 
-                            language=self.language)
-        members = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
+        q = Source.DESCRIBE_QUERY.format(pattern='GRAPH ?g {{ {} }}'.format(self.describe_pattern(uri)))
+        return Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
+
+    DESCRIBE_QUERY = """
+            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+            PREFIX dct: <http://purl.org/dc/terms/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            SELECT DISTINCT ?p ?o ?label
+            WHERE {{ {pattern} }}"""
+
+    def describe_pattern(self, uri):
+        """
+        The graph pattern of _describe()'s query, for sources whose endpoints need it wrapped differently
+        """
+        return """
+                VALUES ?p {{
+                    rdf:type
+                    skos:prefLabel skos:definition skos:altLabel skos:hiddenLabel dct:source dct:contributor
+                    dct:created dct:modified
+                    skos:broader skos:narrower
+                    skos:exactMatch skos:closeMatch skos:broadMatch skos:narrowMatch skos:relatedMatch
+                    rdfs:label rdfs:comment skos:member
+                }}
+                <{uri}> ?p ?o .
+                # all prefLabels are wanted, one per language, and classes & related objects are IRIs
+                FILTER(?p IN (rdf:type, skos:prefLabel, skos:broader, skos:narrower, skos:exactMatch, skos:closeMatch,
+                              skos:broadMatch, skos:narrowMatch, skos:relatedMatch, skos:member)
+                       || lang(?o) = "{language}" || lang(?o) = "")
+                OPTIONAL {{ ?o skos:prefLabel ?label .
+                    FILTER(lang(?label) = "{language}" || lang(?label) = "") }}
+            """.format(uri=uri,
+                       language=self.language)
+
+    @staticmethod
+    def _object_class(rows):
+        """
+        Picks the first class we understand (SKOS) from _describe() rows
+        """
+        for row in rows or []:
+            if row['p']['value'] == str(RDF.type) and row['o']['value'] in Source.VOC_TYPES:
+                return row['o']['value']
+        return None
+
+    def _make_collection(self, uri, result):
+        """
+        Folds _describe() rows into a Collection, its members sorted by label
+        """
+        label = None
+        comment = None
+        members = {}
+        for row in result or []:
+            p = row['p']['value']
+            value = row['o'].get('value')
+            if p == str(RDFS.label) or (p == str(SKOS.prefLabel) and label is None):
+                label = value
+            elif p == str(RDFS.comment):
+                comment = value
+            elif p == str(SKOS.member):
+                members[value] = row['label']['value'] if row.get('label') else value
 
         from model.collection import Collection
         return Collection(
             self.vocab_id,
             uri,
-            metadata[0]['l']['value'],
-            metadata[0].get('c').get('value') if metadata[0].get('c') is not None else None,
-            [(x.get('m').get('value'), x.get('m').get('value')) for x in members]
+            label,
+            comment,
+            sorted(members.items(), key=lambda m: m[1])
         )
 
-    def get_concept(self):
+    def _make_concept(self, uri, result):
+        """
+        Folds _describe() rows into a Concept
+        """
         vocab = g.VOCABS[self.vocab_id]
-        q = """
-            PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-            PREFIX dct: <http://purl.org/dc/terms/>
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX dc: <http://purl.org/dc/elements/1.1/>
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            SELECT DISTINCT *
-            WHERE  {{ GRAPH ?g {{
-                {{ <{concept_uri}> skos:prefLabel ?prefLabel . # ?s skos:prefLabel|dct:title|rdfs:label ?prefLabel .
-                    # FILTER(lang(?prefLabel) = "{language}" || lang(?prefLabel) = "") 
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:definition ?definition .
-                    FILTER(lang(?definition) = "{language}" || lang(?definition) = "") }}
-                OPTIONAL {{ <{concept_uri}> skos:altLabel ?altLabel .
-                    FILTER(lang(?altLabel) = "{language}" || lang(?altLabel) = "") }}
-                OPTIONAL {{ <{concept_uri}> skos:hiddenLabel ?hiddenLabel .
-                    FILTER(lang(?hiddenLabel) = "{language}" || lang(?hiddenLabel) = "") }}
-                OPTIONAL {{ <{concept_uri}> dct:source ?source .
-                    FILTER(lang(?source) = "{language}" || lang(?source) = "") }}
-                OPTIONAL {{ <{concept_uri}> dct:contributor ?contributor .
-                    FILTER(lang(?contributor) = "{language}" || lang(?contributor) = "") }}
-                OPTIONAL {{ <{concept_uri}> skos:broader ?broader .
-                    OPTIONAL {{ ?broader skos:prefLabel ?broaderLabel .
-                        FILTER(lang(?broaderLabel) = "{language}" || lang(?broaderLabel) = "") }} 
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:narrower ?narrower .
-                    OPTIONAL {{ ?narrower skos:prefLabel ?narrowerLabel .
-                        FILTER(lang(?narrowerLabel) = "{language}" || lang(?narrowerLabel) = "") }} 
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:exactMatch ?exactMatch .
-                    OPTIONAL {{ ?exactMatch skos:prefLabel ?exactMatchLabel .
-                        FILTER(lang(?exactMatchLabel) = "{language}" || lang(?exactMatchLabel) = "") }}
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:closeMatch ?closeMatch .
-                    OPTIONAL {{ ?closeMatch skos:prefLabel ?closeMatchLabel .
-                        FILTER(lang(?closeMatchLabel) = "{language}" || lang(?closeMatchLabel) = "") }}
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:broadMatch ?broadMatch .
-                    OPTIONAL {{ ?broadMatch skos:prefLabel ?broadMatchLabel .
-                        FILTER(lang(?broadMatchLabel) = "{language}" || lang(?broadMatchLabel) = "") }}
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:narrowMatch ?narrowMatch .
-                    OPTIONAL {{ ?narrowMatch skos:prefLabel ?narrowMatchLabel .
-                        FILTER(lang(?narrowMatchLabel) = "{language}" || lang(?narrowMatchLabel) = "") }}
-                    }}
-                OPTIONAL {{ <{concept_uri}> skos:relatedMatch ?relatedMatch .                
-                    OPTIONAL {{ ?relatedMatch skos:prefLabel ?relatedMatchLabel .
-                        FILTER(lang(?relatedMatchLabel) = "{language}" || lang(?relatedMatchLabel) = "") }}
-                    }}
-                OPTIONAL {{ <{concept_uri}> dct:created ?created }}
-                OPTIONAL {{ <{concept_uri}> dct:modified ?modified }}
-            }} }}""".format(concept_uri=self.request.values.get('uri'), 
-                            language=self.language)
-            
-        result = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
-        
-        assert result, 'Unable to query concepts for {}'.format(self.request.values.get('uri'))
+
+        assert result, 'Unable to query concepts for {}'.format(uri)
 
         prefLabel = None
         definition = None
         lang_prefLabels = {}
-        altLabels = []
-        hiddenLabels = []
+        altLabels = set()
+        hiddenLabels = set()
         source = None
-        contributors = []
+        contributors = set()
+        created = None
+        modified = None
         
         concept_relationships = {        
             'broader': {},
@@ -212,47 +392,50 @@ class Source:
             }
         
         for row in result:
-            preflabel_lang = row['prefLabel'].get('xml:lang') or ''
-            # Use default language or no language prefLabel as primary
-            if ((not prefLabel and preflabel_lang == '') or 
-                (preflabel_lang == self.language)
-                ):
-                prefLabel = row['prefLabel']['value']
-                
-            if preflabel_lang not in ['', self.language]:
-                lang_prefLabels[preflabel_lang] = row['prefLabel']['value']
-
-            if row.get('definition'):
-                definition = row['definition']['value']
-            else:
-                definition = None
-
-            if row.get('altLabel'):
-                if row['altLabel']['value'] is not None and row['altLabel']['value'] not in altLabels:
-                    altLabels.append(row['altLabel']['value'])
-
-            if row.get('hiddenLabel'):
-                if row['hiddenLabel']['value'] is not None and row['hiddenLabel']['value'] not in hiddenLabels:
-                    hiddenLabels.append(row['hiddenLabel']['value'])
-
-            if row.get('source'):
-                source = row['source']['value']
-
-            if row.get('contributor'):
-                if row['contributor']['value'] is not None and row['contributor']['value'] not in contributors:
-                    contributors.append(row['contributor']['value'])
-
-            for relationship, related_concepts in concept_relationships.items():
-                if row.get(relationship) and row[relationship].get('value'):
-                    relatedConceptLabel = (row[relationship+'Label']['value'] if row.get(relationship+'Label') and row[relationship+'Label'].get('value') 
-                                           else make_title(row[relationship]['value'])) # No prefLabel
-                    related_concepts[row[relationship]['value']] = relatedConceptLabel
+            # the local name of the property, e.g. prefLabel or broader
+            p = row['p']['value'].split('#')[-1].split('/')[-1]
+            value = row['o'].get('value')
+            if value is None:
+                continue
+
+            if p == 'prefLabel':
+                preflabel_lang = row['o'].get('xml:lang') or ''
+                # Use default language or no language prefLabel as primary
+                if ((not prefLabel and preflabel_lang == '') or 
+                    (preflabel_lang == self.language)
+                    ):
+                    prefLabel = value
+
+                if preflabel_lang not in ['', self.language]:
+                    lang_prefLabels[preflabel_lang] = value
+            elif p == 'definition':
+                definition = value
+            elif p == 'altLabel':
+                altLabels.add(value)
+            elif p == 'hiddenLabel':
+                hiddenLabels.add(value)
+            elif p == 'source':
+                source = value
+            elif p == 'contributor':
+                contributors.add(value)
+            elif p == 'created':
+                created = dateutil.parser.parse(value)
+            elif p == 'modified':
+                modified = dateutil.parser.parse(value)
+            elif p in concept_relationships:
+                related_concepts = concept_relationships[p]
+                if row.get('label') and row['label'].get('value'):
+                    related_concepts[value] = row['label']['value']
+                elif value not in related_concepts:
+                    related_concepts[value] = make_title(value)  # No prefLabel
+
+        assert prefLabel is not None or lang_prefLabels, 'Unable to query concepts for {}'.format(uri)
 
         lang_prefLabels = OrderedDict([(key, lang_prefLabels[key]) 
                                        for key in sorted(lang_prefLabels.keys())])
-        altLabels.sort()
-        hiddenLabels.sort()
-        contributors.sort()
+        altLabels = sorted(altLabels)
+        hiddenLabels = sorted(hiddenLabels)
+        contributors = sorted(contributors)
         
         for relationship, related_concepts in concept_relationships.items():
             concept_relationships[relationship] = OrderedDict([(key, related_concepts[key]) 
@@ -269,8 +452,8 @@ class Source:
             contributors=contributors,
             concept_relationships=concept_relationships,
             semantic_properties=None,
-            created=None,
-            modified=None,
+            created=created,
+            modified=modified,
             lang_prefLabels=lang_prefLabels
         )
 
@@ -293,58 +476,9 @@ class Source:
                        language=self.language)
         cs = Source.sparql_query(vocab.sparql_endpoint, q, vocab.sparql_username, vocab.sparql_password)
 
-        hierarchy = []
-        previous_parent_uri = None
-        last_index = 0
-
-        # cache prefLabels and do not add duplicates. This prevents Concepts with sameAs properties appearing twice
-        pl_cache = []
         if cs[0].get('parent') is not None:
-            for c in cs:
-                # insert all topConceptOf directly
-                if str(c['parent']['value']) == vocab.uri:
-                    if c['pl']['value'] not in pl_cache:  # only add if not already in cache
-                        hierarchy.append((
-                            int(c['length']['value']),
-                            c['c']['value'],
-                            c['pl']['value'],
-                            None
-                        ))
-                        pl_cache.append(c['pl']['value'])
-                else:
-                    if c['pl']['value'] not in pl_cache:  # only add if not already in cache
-                        # If this is not a topConcept, see if it has the same URI as the previous inserted Concept
-                        # If so, use that Concept's index + 1
-                        this_parent = c['parent']['value']
-                        if this_parent == previous_parent_uri:
-                            # use last inserted index
-                            hierarchy.insert(last_index + 1, (
-                                int(c['length']['value']),
-                                c['c']['value'],
-                                c['pl']['value'],
-                                c['parent']['value']
-                            ))
-                            last_index += 1
-                        # This is not a TopConcept and it has a differnt parent from the previous insert
-                        # So insert it after it's parent
-                        else:
-                            i = 0
-                            parent_index = 0
-                            for t in hierarchy:
-                                if this_parent in t[1]:
-                                    parent_index = i
-                                i += 1
-
-                            hierarchy.insert(parent_index + 1, (
-                                int(c['length']['value']),
-                                c['c']['value'],
-                                c['pl']['value'],
-                                c['parent']['value']
-                            ))
-
-                            last_index = parent_index + 1
-                        previous_parent_uri = this_parent
-                        pl_cache.append(c['pl']['value'])
+            # do not add duplicate prefLabels. This prevents Concepts with sameAs properties appearing twice
+            hierarchy = Source.order_concept_hierarchy(cs, vocab.uri, unique_labels=True)
             return Source.draw_concept_hierarchy(hierarchy, self.request, self.vocab_id)
         else:
             return ''  # empty HTML
@@ -366,6 +500,22 @@ class Source:
 
         return None
 
+    def get_object(self, uri):
+        """
+        Gets the class of an object and, if it's a Concept or a Collection, the object itself in a single round trip
+
+        :param uri: the object's URI
+        :return: tuple(class URI or None, Concept or Collection or None)
+        :rtype: tuple
+        """
+        result = self._describe(uri)
+        c = Source._object_class(result)
+        if c == 'http://www.w3.org/2004/02/skos/core#Concept':
+            return c, self._make_concept(uri, result)
+        elif c == 'http://www.w3.org/2004/02/skos/core#Collection':
+            return c, self._make_collection(uri, result)
+        return c, None
+
     @staticmethod
     def get_prefLabel_from_uri(uri):
         return ' '.join(str(uri).split('#')[-1].split('/')[-1].split('_'))
@@ -373,74 +523,155 @@ class Source:
     @staticmethod
     def get_narrowers(uri, depth):
         """
-        Recursively get all skos:narrower properties as a list.
+        Gets all the Concepts narrower than a Concept, from its and their <uri>.ttl documents, as a list.
+
+        The documents are fetched a level at a time, each level's concurrently, and cached (see DocumentCache). The list
+        is in depth-first order, each Concept followed by its own narrowers, with siblings sorted by prefLabel.
 
         :param uri: URI node
         :param depth: The current depth
-        :param g: The graph
         :return: list of tuples(tree_depth, uri, prefLabel)
         :rtype: list
         """
-        depth += 1
-
-        # Some RVA sources won't load on first try, so ..
-        # if failed, try load again.
-        g = None
-        max_attempts = 10
-        for i in range(max_attempts):
-            try:
-                g = Graph().parse(uri + '.ttl', format='turtle')
-                break
-            except:
-                logging.warning('Failed to load resource at URI {}. Attempt: {}.'.format(uri, i+1))
-        if not g:
-            raise Exception('Failed to load Graph from {}. Maximum attempts exceeded {}.'.format(uri, max_attempts))
+        narrowers = {}  # URI -> its narrower Concepts' URIs
+        seen = {uri}
+        level = [uri]
+        while level:
+            futures = [(u, NARROWER_EXECUTOR.submit(Source.fetch_narrowers, u)) for u in level]
+            level = []
+            for u, future in futures:
+                narrowers[u] = future.result()
+                for n in narrowers[u]:
+                    if n not in seen:
+                        seen.add(n)
+                        level.append(n)
 
         items = []
-        for s, p, o in g.triples((None, SKOS.broader, URIRef(uri))):
-            items.append((depth, str(s), Source.get_prefLabel_from_uri(s)))
-        items.sort(key=lambda x: x[2])
-        count = 0
-        for item in items:
-            count += 1
-            new_items = Source.get_narrowers(item[1], item[0])
-            items = items[:count] + new_items + items[count:]
-            count += len(new_items)
+        # each stack entry is a Concept, its depth and the Concepts above it, so that cycles aren't followed
+        stack = [(n, depth + 1, (uri,)) for n in reversed(Source.sort_narrowers(narrowers[uri])) if n != uri]
+        while stack:
+            n, d, above = stack.pop()
+            items.append((d, n, Source.get_prefLabel_from_uri(n)))
+            above += (n,)
+            stack.extend((c, d + 1, above) for c in reversed(Source.sort_narrowers(narrowers[n])) if c not in above)
         return items
 
+    @staticmethod
+    def sort_narrowers(uris):
+        return sorted(uris, key=Source.get_prefLabel_from_uri)
+
+    @staticmethod
+    def fetch_narrowers(uri):
+        """
+        Gets the Concepts that say they are narrower than a Concept in its <uri>.ttl document
+
+        :param uri: the Concept's URI
+        :return: the narrower Concepts' URIs
+        :rtype: list
+        """
+        # the document's relative URIs are relative to where it was fetched from
+        document = uri + '.ttl'
+        turtle = DOCUMENT_CACHE.get(document, {'Accept': 'text/turtle'})
+        g = Graph().parse(data=turtle, format='turtle', publicID=document)
+        return [str(s) for s in g.subjects(SKOS.broader, URIRef(uri))]
+
+    @staticmethod
+    def order_concept_hierarchy(cs, concept_scheme_uri, unique_labels=False):
+        """
+        Orders the rows of a concept hierarchy query as a tree: depth-first from the top concepts, each Concept followed
+        by its narrower Concepts sorted by prefLabel. Concepts whose parent isn't in the hierarchy follow the tree.
+
+        :param cs: query result rows, each with 'length', 'c', 'pl' & 'parent' values, ordered by length
+        :param concept_scheme_uri: the URI that top concepts have as their parent
+        :param unique_labels: only keep the first Concept with each prefLabel
+        :return: list of tuples(tree_depth, uri, prefLabel, parent uri)
+        :rtype: list
+        """
+        top_concepts = []
+        narrowers = OrderedDict()  # parent URI -> its narrower Concepts' tuples
+        labels = set()
+        for c in cs:
+            if unique_labels:
+                if c['pl']['value'] in labels:
+                    continue
+                labels.add(c['pl']['value'])
+            if str(c['parent']['value']) == concept_scheme_uri:
+                top_concepts.append((int(c['length']['value']), c['c']['value'], c['pl']['value'], None))
+            else:
+                narrowers.setdefault(str(c['parent']['value']), []).append(
+                    (int(c['length']['value']), c['c']['value'], c['pl']['value'], c['parent']['value'])
+                )
+        for items in narrowers.values():
+            items.sort(key=lambda item: str(item[2]))
+
+        hierarchy = []
+        expanded = set()  # a Concept's narrowers are only listed under its first appearance, which also stops cycles
+
+        def add_branches(items):
+            stack = list(reversed(items))
+            while stack:
+                item = stack.pop()
+                hierarchy.append(item)
+                if str(item[1]) not in expanded:
+                    expanded.add(str(item[1]))
+                    stack.extend(reversed(narrowers.get(str(item[1]), [])))
+
+        add_branches(top_concepts)
+        for parent_uri, items in narrowers.items():
+            if parent_uri not in expanded:
+                expanded.add(parent_uri)
+                add_branches(items)
+        return hierarchy
+
     @staticmethod
     def draw_concept_hierarchy(hierarchy, request, id):
-        tab = '\t'
+        return ''.join(Source.render_concept_hierarchy(hierarchy, request, id))
+
+    @staticmethod
+    def render_concept_hierarchy(hierarchy, request, id):
+        """
+        Renders an ordered concept hierarchy as nested HTML lists of links to each Concept, in a single pass.
+
+        :param hierarchy: list of tuples(tree_depth, uri, prefLabel, parent uri), as per order_concept_hierarchy()
+        :param request: the Flask request, for the links' root URL
+        :param id: the vocab ID
+        :return: generator of HTML fragments
+        :rtype: generator
+        """
+        object_url = request.url_root + 'object?vocab_id=' + id + '&uri='
         previous_length = 1
+        level = -1  # nesting level of the previous item, -1 before the outer list is opened
+        indents = {}  # URI -> nesting level of each item so far
 
-        text = ''
-        tracked_items = []
         for item in hierarchy:
             mult = None
 
             if item[0] > previous_length + 2: # SPARQL query error on length value
-                for tracked_item in tracked_items:
-                    if tracked_item['name'] == item[3]:
-                        mult = tracked_item['indent'] + 1
-
-            if mult is None:
-                found = False
-                for tracked_item in tracked_items:
-                    if tracked_item['name'] == item[3]:
-                        found = True
-                if not found:
-                    mult = 0
+                if item[3] in indents:
+                    mult = indents[item[3]] + 1
+
+            if mult is None and item[3] not in indents:
+                mult = 0
 
             if mult is None: # else: # everything is normal
                 mult = item[0] - 1
 
-            import helper as h
-            t = tab * mult + '* [' + item[2] + '](' + request.url_root + 'object?vocab_id=' + id + '&uri=' + h.url_encode(item[1]) + ')\n'
-            text += t
+            # a list can only be nested one level deeper than the item it is in
+            mult = min(mult, level + 1)
+            if mult > level:
+                yield '<ul>\n'
+            else:
+                yield '</li>\n' + '</ul>\n</li>\n' * (level - mult)
+            yield '<li><a href="{}">{}</a>'.format(
+                escape(object_url + url_encode(item[1])),
+                escape(str(item[2]), quote=False)
+            )
             previous_length = mult
-            tracked_items.append({'name': item[1], 'indent': mult})
+            level = mult
+            indents[item[1]] = mult
 
-        return markdown.markdown(text)
+        if level >= 0:
+            yield '</li>\n' + '</ul>\n</li>\n' * level + '</ul>'
 
     def get_top_concepts(self):
         vocab = g.VOCABS[self.vocab_id]
@@ -494,20 +725,19 @@ class Source:
 
     @staticmethod
     def sparql_query(endpoint, q, sparql_username=None, sparql_password=None):
-        sparql = SPARQLWrapper(endpoint)
-        sparql.setQuery(q)
-        sparql.setReturnFormat(JSON)
+        # results are reused from the query cache until they expire, failed queries aren't cached
+        key = QueryCache.key(endpoint, q, sparql_username, sparql_password)
+        metadata = QUERY_CACHE.get(key)
+        if metadata is not None:
+            return metadata
 
-        
-        if sparql_username and sparql_password:            
-            sparql.setHTTPAuth(BASIC)
-            sparql.setCredentials(sparql_username, sparql_password)
-            
         try:
-            metadata = sparql.query().convert()['results']['bindings']
-        except:
+            metadata = SparqlTransport.for_endpoint(endpoint).query(q, sparql_username, sparql_password)['results']['bindings']
+        except Exception as e:
+            logging.debug('SPARQL query to {} failed: {}'.format(endpoint, e))
             return None
-        
+
+        QUERY_CACHE.put(key, metadata)
         return metadata
 
     # @staticmethod
@@ -0,0 +1,126 @@
+import _config as config
+import threading
+import time
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+
+# the maximum number of kept-alive connections to each SPARQL endpoint
+if hasattr(config, 'SPARQL_POOL_SIZE'):
+    POOL_SIZE = config.SPARQL_POOL_SIZE
+else:
+    POOL_SIZE = 10
+
+# seconds to wait for a connection to, and then for a response from, a SPARQL endpoint
+if hasattr(config, 'SPARQL_CONNECT_TIMEOUT'):
+    CONNECT_TIMEOUT = config.SPARQL_CONNECT_TIMEOUT
+else:
+    CONNECT_TIMEOUT = 5
+
+if hasattr(config, 'SPARQL_READ_TIMEOUT'):
+    READ_TIMEOUT = config.SPARQL_READ_TIMEOUT
+else:
+    READ_TIMEOUT = 30
+
+# the time by which the current thread's queries must be answered, if it has one
+_deadline = threading.local()
+
+
+class SparqlTransport:
+    """
+    A pool of keep-alive HTTP connections to a single SPARQL endpoint, shared by all threads of this process
+
+    Use SparqlTransport.for_endpoint() rather than creating these directly so there is only one pool per endpoint.
+    Endpoints that aren't HTTP URLs get the transport class registered for their scheme in SCHEMES instead.
+    """
+    # endpoint URI schemes, e.g. 'oxigraph', mapped to the transport classes that query them
+    SCHEMES = {}
+    _transports = {}
+    _lock = threading.Lock()
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self._auths = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/sparql-results+json',
+            'Accept-Encoding': 'gzip, deflate'
+        })
+
+    @classmethod
+    def for_endpoint(cls, endpoint):
+        """
+        Gets the transport for a SPARQL endpoint, creating it on first use
+        :param endpoint: the SPARQL endpoint's URL
+        :return: the endpoint's transport
+        :rtype: SparqlTransport
+        """
+        transport = cls._transports.get(endpoint)
+        if transport is None:
+            with cls._lock:
+                transport = cls._transports.get(endpoint)
+                if transport is None:
+                    transport_class = cls.SCHEMES.get(endpoint.split(':', 1)[0], cls)
+                    transport = cls._transports[endpoint] = transport_class(endpoint)
+        return transport
+
+    @staticmethod
+    @contextmanager
+    def deadline(at):
+        """
+        Makes the queries sent by this thread within the context wait no longer for a response than until a deadline,
+        even if READ_TIMEOUT is longer
+        :param at: the deadline, as a time.time() timestamp
+        """
+        previous = getattr(_deadline, 'at', None)
+        _deadline.at = at if previous is None else min(at, previous)
+        try:
+            yield
+        finally:
+            _deadline.at = previous
+
+    @staticmethod
+    def read_timeout():
+        """
+        Gets the seconds to wait for a response: READ_TIMEOUT, or less if this thread's deadline is sooner
+        :raises requests.exceptions.Timeout: if the deadline has passed
+        """
+        at = getattr(_deadline, 'at', None)
+        if at is None:
+            return READ_TIMEOUT
+        remaining = at - time.time()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout('The query deadline has passed')
+        return min(READ_TIMEOUT, remaining)
+
+    def auth(self, username, password):
+        """
+        Gets the Basic auth for a set of credentials, made once per transport and then reused
+        """
+        if not (username and password):
+            return None
+        key = (username, password)
+        if key not in self._auths:
+            self._auths[key] = requests.auth.HTTPBasicAuth(username, password)
+        return self._auths[key]
+
+    def query(self, q, username=None, password=None):
+        """
+        Sends a SPARQL query to the endpoint using the SPARQL 1.1 Protocol's URL-encoded POST
+        :param q: the SPARQL query
+        :param username: optional Basic auth username
+        :param password: optional Basic auth password
+        :return: the SPARQL JSON results
+        :rtype: dict
+        """
+        r = self.session.post(
+            self.endpoint,
+            data={'query': q},
+            auth=self.auth(username, password),
+            timeout=(CONNECT_TIMEOUT, self.read_timeout())
+        )
+        r.raise_for_status()
+        return r.json()
@@ -0,0 +1,354 @@
+import _config as config
+import data.source as source
+import os
+import pickle
+import threading
+import time
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from data.label_index import LabelIndex
+
+# the maximum number of vocab sources collected at once
+if hasattr(config, 'VOCAB_COLLECT_WORKERS'):
+    COLLECT_WORKERS = config.VOCAB_COLLECT_WORKERS
+else:
+    COLLECT_WORKERS = 8
+
+# seconds allowed for each vocab source's collect(), which can be overridden by a 'collect_timeout' in its details
+if hasattr(config, 'VOCAB_COLLECT_TIMEOUT'):
+    COLLECT_TIMEOUT = config.VOCAB_COLLECT_TIMEOUT
+else:
+    COLLECT_TIMEOUT = 120
+
+# the number of distinct register searches whose results are kept, per index
+if hasattr(config, 'VOCAB_REGISTER_SEARCH_CACHE'):
+    REGISTER_SEARCH_CACHE = config.VOCAB_REGISTER_SEARCH_CACHE
+else:
+    REGISTER_SEARCH_CACHE = 256
+
+
+class VocabRegister:
+    """
+    A read-only view of a vocab index's vocabs sorted by title, as listed by the /vocabulary/ register
+
+    Built once for each index, with each title's casefolded collation key, so a page of the register is a slice. A
+    search filters the keys in their (already sorted) order and its result is remembered, so paging through a search's
+    results, as crawlers and harvesters do, is a slice too.
+    """
+    def __init__(self, vocabs):
+        self.vocabs = vocabs
+        ordered = sorted(
+            vocabs.values(),
+            key=lambda v: (VocabRegister.collation_key(v.title), v.title or '')
+        )
+        self.ordered = tuple(ordered)
+        self.keys = tuple(VocabRegister.collation_key(v.title) for v in ordered)
+        self._search = lru_cache(maxsize=REGISTER_SEARCH_CACHE)(self._search)
+
+    @staticmethod
+    def collation_key(title):
+        return (title or '').casefold()
+
+    def __len__(self):
+        return len(self.ordered)
+
+    def page(self, start, end, matches=None):
+        """
+        Gets a page of the register
+        :param start: the index of the page's first vocab
+        :param end: the index after the page's last vocab
+        :param matches: the positions of a search's vocabs, from search(), to page through them instead
+        :return: the page's Vocabulary objects
+        :rtype: list
+        """
+        if matches is None:
+            return list(self.ordered[start:end])
+        return [self.ordered[i] for i in matches[start:end]]
+
+    def search(self, query):
+        """
+        Finds the vocabs whose titles contain a query, ignoring case
+        :return: their positions in the register, in register order
+        :rtype: tuple
+        """
+        return self._search(VocabRegister.collation_key(query))
+
+    def _search(self, key):
+        return tuple(i for i, title_key in enumerate(self.keys) if key in title_key)
+
+
+class VocabIndex:
+    """
+    Process-wide index of the vocabs from all of the vocab sources defined in config/__init__.py -> VOCAB_SOURCES
+
+    The index is loaded once per process, either from the pickled VOCAB_CACHE_PATH file or by calling collect() for
+    each vocab source, and is then shared by every request (thread). The index dict is never modified once built, a
+    new index replaces it with a single reference assignment so readers see either all of the old or all of the new.
+
+    Once started, a background refresher rebuilds the index when it gets too old, serving the old one until then.
+
+    Each index's label index, for searching all of its vocabs' Concepts, is built in the background once it is swapped
+    in. The previous label index is searched until then.
+    """
+    # seconds to wait before trying again after a failed background rebuild
+    RETRY_SECONDS = 300
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._register = None  # the current index's VocabRegister, which holds its vocabs
+        self._labels = LabelIndex([])
+        self._built = None  # time the current index was built
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+        self._collected = {}  # the vocabs last collected from each vocab source
+        self._fresh = False  # load() has just collected the index from the vocab sources
+        self._missing = []  # the vocab sources whose vocabs the last collect() couldn't get
+
+    @property
+    def vocabs(self):
+        """
+        The current vocab index, loading it first if this process hasn't already done so
+        :return: vocab IDs mapped to their Vocabulary objects
+        :rtype: dict
+        """
+        return self.register.vocabs
+
+    @property
+    def register(self):
+        """
+        The current vocab index's register view, loading the index first if this process hasn't already done so
+        :return: the index's vocabs sorted by title
+        :rtype: VocabRegister
+        """
+        register = self._register
+        if register is None:
+            self.load()
+            register = self._register
+        return register
+
+    @property
+    def labels(self):
+        """
+        The label index of the current vocab index, or of the one before it while it's being built
+        :rtype: LabelIndex
+        """
+        return self._labels
+
+    def load(self):
+        """
+        Loads the vocab index from disk (VOCABS.p) or, failing that, from a complete reload of the vocab sources. Only
+        the first caller does any work, concurrent callers wait for it and then share its result
+        :return: vocab IDs mapped to their Vocabulary objects
+        :rtype: dict
+        """
+        with self._lock:
+            if self._register is None:
+                built = self.modified()
+                vocabs = self.read()
+                missing = False
+                if not vocabs:
+                    built = time.time()
+                    vocabs = self.collect()
+                    missing = bool(self._missing)
+                    if not missing:
+                        self.write(vocabs)
+                        # as written, so the refresher doesn't take this process's file for another's newer index
+                        built = self.modified() or built
+                        self._fresh = True
+                self.swap(vocabs, built)
+                if missing:
+                    # serve what there is but don't store it, and have the refresher collect again straight away
+                    self._built = None
+            return self._register.vocabs
+
+    def swap(self, vocabs, built=None):
+        """
+        Replaces the whole index with a new one, along with its register view
+        :param vocabs: vocab IDs mapped to their Vocabulary objects
+        :param built: the time the new index was built, defaults to now
+        :return: nothing
+        """
+        register = VocabRegister(vocabs)
+        self._register = register
+        self._built = built or time.time()
+        threading.Thread(
+            target=self._index_labels,
+            args=(register,),
+            name='label-indexer',
+            daemon=True
+        ).start()
+
+    def _index_labels(self, register):
+        try:
+            labels = LabelIndex.build(register.vocabs)
+        except Exception as e:
+            logging.error('Unable to build the label index: {}'.format(e))
+            return
+        # a newer index may have been swapped in meanwhile, its own label index will follow
+        if self._register is register:
+            self._labels = labels
+
+    def rebuild(self):
+        """
+        Recreates the index from the vocab sources, stores it on disk and then swaps it in. If the sources yield no
+        vocabs at all, or a source failed with no vocabs of its own from an earlier collect() to fall back on, the
+        current index is kept and the refresher tries again later
+        :return: vocab IDs mapped to their Vocabulary objects
+        :rtype: dict
+        """
+        vocabs = self.collect()
+        if not vocabs:
+            logging.error('Rebuilding the vocab index found no vocabs, keeping the current index')
+            return self._register.vocabs if self._register else None
+        if self._missing and self._register is not None:
+            # writing it would drop the sources' vocabs from every process's index until the next rebuild
+            logging.error('Rebuilding the vocab index couldn\'t collect vocab sources {}, keeping the current index'
+                          .format(', '.join(self._missing)))
+            return self._register.vocabs
+        self.write(vocabs)
+        self.swap(vocabs, self.modified())
+        return vocabs
+
+    def age(self):
+        """
+        Seconds since the current index was built, or since the on-disk index was if another process has written a
+        newer one
+        :return: age in seconds, None if there is no index yet
+        :rtype: float
+        """
+        built = max(self._built or 0, self.modified() or 0)
+        return time.time() - built if built else None
+
+    def refresh(self, max_age):
+        """
+        Brings the index up to date if it is older than max_age seconds. A newer index written to disk by another
+        process is read in, otherwise the index is rebuilt from the vocab sources
+        :param max_age: the maximum age of the index in seconds
+        :return: nothing
+        """
+        fresh, self._fresh = self._fresh, False
+        if fresh:
+            return  # load() has only just collected it
+        if self._built is not None and (self.modified() or 0) > self._built and self.age() < max_age:
+            vocabs = self.read()
+            if vocabs:
+                self.swap(vocabs, self.modified())
+                return
+        if self.age() is None or self.age() >= max_age:
+            self.rebuild()
+
+    def start_refresher(self, max_age):
+        """
+        Starts a background thread that keeps the index no older than max_age seconds. Requests keep being served from
+        the current index while a new one is built and then swapped in. With a max_age of 0, the index is rebuilt once
+        :param max_age: the maximum age of the index in seconds
+        :return: nothing
+        """
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(
+            target=self._refresh_loop,
+            args=(max_age,),
+            name='vocab-index-refresher',
+            daemon=True
+        )
+        self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+
+    def _refresh_loop(self, max_age):
+        while not self._stop.is_set():
+            try:
+                self.refresh(max_age)
+            except Exception as e:
+                logging.error('Unable to refresh the vocab index: {}'.format(e))
+            if max_age <= 0:
+                return
+            # still stale means the refresh failed so try again later
+            age = self.age() or max_age
+            self._stop.wait(max_age - age if age < max_age else VocabIndex.RETRY_SECONDS)
+
+    def read(self):
+        """
+        Reads a pickled vocab index from disk
+        :return: vocab IDs mapped to their Vocabulary objects or None if there's no readable file
+        :rtype: dict
+        """
+        if not os.path.isfile(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logging.debug('Unable to read vocab index file {}: {}'.format(self.cache_path, e))
+            return None
+
+    def modified(self):
+        """
+        The time the on-disk index was last written
+        :return: seconds since the epoch, None if there is no file
+        :rtype: float
+        """
+        try:
+            return os.stat(self.cache_path).st_mtime
+        except OSError:
+            return None
+
+    def write(self, vocabs):
+        """
+        Pickles a vocab index to disk. The file is written alongside and then moved into place so that other
+        processes never read a partially-written index
+        :param vocabs: vocab IDs mapped to their Vocabulary objects
+        :return: nothing
+        """
+        if not vocabs:  # Don't write empty file
+            return
+        tmp_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(vocabs, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def collect(self):
+        """
+        Runs collect() on each vocab source, using the appropriate class (from details['source']), to gather all their
+        vocabs. The sources are collected concurrently, each within its own timeout, and their vocabs merged in the
+        order of VOCAB_SOURCES. A source that fails or times out contributes the vocabs it gave the last time it
+        succeeded in this process, if any, or is listed in self._missing
+        :return: vocab IDs mapped to their Vocabulary objects
+        :rtype: dict
+        """
+        if not config.VOCAB_SOURCES:
+            return {}
+        workers = min(len(config.VOCAB_SOURCES), COLLECT_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vocab-collect')
+        started = time.time()
+        try:
+            futures = OrderedDict(
+                (name, executor.submit(getattr(source, details['source']).collect, details))
+                for name, details in config.VOCAB_SOURCES.items()
+            )
+            vocabs = {}
+            missing = []
+            for name, future in futures.items():
+                timeout = config.VOCAB_SOURCES[name].get('collect_timeout', COLLECT_TIMEOUT)
+                try:
+                    self._collected[name] = future.result(timeout=max(started + timeout - time.time(), 0)) or {}
+                except TimeoutError:
+                    logging.error('Vocab source {} took longer than {}s to collect'.format(name, timeout))
+                except Exception as e:
+                    logging.error('Unable to collect vocab source {}: {}'.format(name, e))
+                if name not in self._collected:
+                    missing.append(name)
+                vocabs.update(self._collected.get(name, {}))
+            self._missing = missing
+            return vocabs
+        finally:
+            # don't wait for timed out sources, their results are discarded
+            executor.shutdown(wait=False)
+
+
+VOCAB_INDEX = VocabIndex(config.VOCAB_CACHE_PATH)